@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+/search レスポンスのシリアライズ時間と転送サイズを計測するスクリプト。
+
+format_search_hit で整形した100件分の検索結果（日本語のメッセージとURLを含む）について、
+以下を比較する。
+- FastAPIの既定の処理（jsonable_encoder + JSONResponse）
+- json_response() によるjsonable_encoderの省略（JSON_RESPONSE=json）
+- orjsonによるシリアライズ（JSON_RESPONSE=orjson）
+転送サイズは無圧縮、gzip（レベル6/9）、brotli（brotliがインストールされている場合）で比較する。
+
+使い方:
+    cd api
+    python benchmark_json.py
+    python benchmark_json.py -n 2000 --hits 100
+"""
+
+import argparse
+import gzip
+import os
+import random
+import sys
+import timeit
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# main.pyのインポートに必要な環境変数（未設定の場合のみダミー値を使う）
+DEFAULT_ENV = {
+    "CORS_ORIGINS": "http://localhost:3000",
+    "ELASTICSEARCH_HOST": "http://127.0.0.1:9",
+    "VIDEOS_INDEX_NAME": "videos",
+    "CHAT_LOGS_INDEX_NAME": "youtube-chat-logs",
+    "THUMBNAIL_BASE_URL": "https://utsulog.example.com/thumbnails",
+    "AUTHOR_ICON_BASE_URL": "https://utsulog.example.com/author-icons",
+}
+
+MESSAGES = [
+    "こんばんは！今日も配信ありがとう",
+    "草",
+    "うつろさんの歌声ほんとに好き :heart:",
+    "ここ何回聞いても泣ける……",
+    "初見です！切り抜きから来ました",
+    "888888888",
+    "え、今のってもしかして新曲？",
+    "お疲れさまでした！次の配信も楽しみにしてます",
+]
+
+
+def build_payload(n_hits):
+    """
+    Elasticsearchのヒットを模したデータから、/search と同じ形式のレスポンスを作る。
+    """
+    import main
+
+    rng = random.Random(0)
+    hits = []
+    for i in range(n_hits):
+        seconds = rng.randrange(4 * 3600)
+        hits.append({
+            "_id": f"ChwKGkNKLUxfZ{i:06d}",
+            "_source": {
+                "videoId": f"dQw4w9WgX{i % 10}Q",
+                "videoTitle": "【歌枠】リクエストにこたえて歌います！【Vtuber/うつろ】",
+                "datetime": "2024-05-01 21:34:56",
+                "elapsedTime": f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}",
+                "timestamp": 1714566896000 + i * 1000,
+                "message": rng.choice(MESSAGES),
+                "type": "chat",
+                "authorName": f"@視聴者{rng.randrange(1000)}",
+                "authorChannelId": f"UC{rng.randrange(10 ** 20):022d}",
+            },
+        })
+    return {
+        "total": 1000,
+        "totalExact": False,
+        "results": [main.format_search_hit(hit) for hit in hits],
+    }
+
+
+def measure(func, runs):
+    """
+    funcをruns回実行した際の1回あたりの時間(µs)を返す（5回計測した最小値）。
+    """
+    return min(timeit.repeat(func, number=runs, repeat=5)) / runs * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/search レスポンスのシリアライズ時間と転送サイズを計測する")
+    parser.add_argument("-n", "--runs", type=int, default=1000, help="1回の計測での実行回数")
+    parser.add_argument("--hits", type=int, default=100, help="レスポンスに含める検索結果の件数")
+    args = parser.parse_args()
+
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, API_DIR)
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    payload = build_payload(args.hits)
+
+    serializers = {
+        "default (jsonable_encoder + json)": lambda: JSONResponse(content=jsonable_encoder(payload)).body,
+        "json_response (json)": lambda: JSONResponse(content=payload).body,
+    }
+    try:
+        import orjson
+        serializers["json_response (orjson)"] = lambda: orjson.dumps(payload)
+    except ImportError:
+        print("orjson is not installed; skipping orjson.\n")
+
+    print(f"Serialization of a /search response with {args.hits} results (min of 5 x {args.runs} runs):")
+    for name, func in serializers.items():
+        print(f"  {name:<36} {measure(func, args.runs):8.1f} us")
+
+    body = JSONResponse(content=payload).body
+    encodings = {
+        "identity": lambda: body,
+        "gzip (level 6)": lambda: gzip.compress(body, compresslevel=6),
+        "gzip (level 9)": lambda: gzip.compress(body, compresslevel=9),
+    }
+    try:
+        import brotli
+        encodings["br (quality 4)"] = lambda: brotli.compress(body, quality=4)
+    except ImportError:
+        print("\nbrotli is not installed; skipping br.")
+
+    print("\nBytes on the wire and compression time:")
+    for name, func in encodings.items():
+        size = len(func())
+        ratio = size / len(body) * 100
+        print(f"  {name:<16} {size:8d} bytes ({ratio:5.1f}%) {measure(func, max(1, args.runs // 10)):8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
 import os
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.staticfiles import StaticFiles
+import json
+import asyncio
+import base64
+import time
+import hashlib
+import threading
+import csv
+import io
+import bisect
+import random
+import unicodedata
+from collections import OrderedDict
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from elasticsearch import Elasticsearch
+import aiohttp
+from elasticsearch import AsyncElasticsearch
+from elastic_transport import AiohttpHttpNode
+from elastic_transport._node._http_aiohttp import _NEEDS_CLEANUP_CLOSED
+from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from urllib.parse import urlparse, parse_qs
 
 # 環境変数からElasticsearchのホストを取得
@@ -18,21 +34,196 @@ CORS_ORIGINS = os.getenv("CORS_ORIGINS")
 origins = [origin.strip() for origin in CORS_ORIGINS.split(',')]
 VIDEOS_INDEX_NAME = os.getenv("VIDEOS_INDEX_NAME")
 CHAT_LOGS_INDEX_NAME = os.getenv("CHAT_LOGS_INDEX_NAME")
+# チャットログの期間パーティション（"month" / "quarter"）。batch/import_chatlogs.pyと同じ値を指定する。
+# 有効な場合、CHAT_LOGS_INDEX_NAMEは全パーティションを束ねる読み取り用エイリアスになる。
+CHAT_LOGS_PARTITION = os.getenv("CHAT_LOGS_PARTITION", "none")
+CHAT_LOGS_MAX_TARGET_PARTITIONS = 24 # これより多くのパーティションにまたがる検索はエイリアスを対象にする
+# チャットログのルーティング。"videoId"を指定すると、動画IDで絞り込む検索を1つのシャードだけに送る。
+# batch/import_chatlogs.pyで同じ値を指定してインポート（または再インデックス）したデータが前提。
+CHAT_LOGS_ROUTING = os.getenv("CHAT_LOGS_ROUTING", "none")
 AUTHOR_ICON_BASE_URL = os.getenv("AUTHOR_ICON_BASE_URL") 
-SEARCH_TOTAL_HITS = os.getenv("SEARCH_TOTAL_HITS")
+# 検索時に数える総ヒット件数の上限（track_total_hits）。これを超える場合は下限値として返し、
+# 正確な件数は /count で取得する。"true"を指定すると常に正確に数える。
+SEARCH_TOTAL_HITS = os.getenv("SEARCH_TOTAL_HITS") or "1000"
+# 検索の種類ごとの時間予算。timeoutを過ぎるか、各シャードでterminate_after件（0で無制限）を
+# 集めた時点でElasticsearchは検索を打ち切り、それまでの結果を partial: true として返す。
+SEARCH_BUDGETS = {
+    # キーワード検索（multi_match）
+    "keyword": {
+        "timeout": os.getenv("SEARCH_TIMEOUT_KEYWORD", "2s"),
+        "terminate_after": int(os.getenv("SEARCH_TERMINATE_AFTER_KEYWORD", "0")),
+    },
+    # 完全一致検索（match_phrase）
+    "exact": {
+        "timeout": os.getenv("SEARCH_TIMEOUT_EXACT", "3s"),
+        "terminate_after": int(os.getenv("SEARCH_TERMINATE_AFTER_EXACT", "0")),
+    },
+    # キーワードなしで投稿者・動画などの絞り込みのみ
+    "filter": {
+        "timeout": os.getenv("SEARCH_TIMEOUT_FILTER", "1s"),
+        "terminate_after": int(os.getenv("SEARCH_TERMINATE_AFTER_FILTER", "0")),
+    },
+}
+# cursorページネーションで使用するPoint in Timeの保持期間
+PIT_KEEP_ALIVE = os.getenv("PIT_KEEP_ALIVE", "5m")
+SEARCH_PAGE_SIZE = 100 # 1回あたりの取得件数
+# バッチがインポート完了時に世代マーカーを書き込むインデックス
+META_INDEX_NAME = os.getenv("META_INDEX_NAME", "utsulog-meta")
+# 世代マーカーを確認する間隔（秒）
+GENERATION_CHECK_INTERVAL = float(os.getenv("GENERATION_CHECK_INTERVAL", "30"))
+# 投稿者名 -> authorChannelId キャッシュの設定
+AUTHOR_CACHE_SIZE = int(os.getenv("AUTHOR_CACHE_SIZE", "10000"))
+AUTHOR_CACHE_TTL = float(os.getenv("AUTHOR_CACHE_TTL", "3600"))
+# 起動時にキャッシュへ読み込む投稿者数（投稿数の多い順）。0で無効。
+AUTHOR_CACHE_PREWARM = int(os.getenv("AUTHOR_CACHE_PREWARM", "0"))
+# 検索結果キャッシュの設定。SEARCH_CACHE_SIZE=0で無効。
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 有効期限切れの検索結果を、再取得中やElasticsearchの障害時に返してよい期間（秒）
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "300"))
+# 正確な総ヒット件数のキャッシュ設定
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "1000"))
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "600"))
+# batch/import_chatlogs.pyがインポート時に更新する投稿者インデックス（authorChannelIdごとの名前・投稿数など）。
+# 投稿者名の解決とサジェストに使い、存在しない場合はチャットログの集計で代替する。空文字列で無効。
+AUTHORS_INDEX_NAME = os.getenv("AUTHORS_INDEX_NAME", "youtube-chat-authors")
+AUTHORS_LOOKUP_SIZE = 10 # 1つの投稿者名から解決するauthorChannelIdの最大数
+# 1を指定すると、完全一致検索を message.bigram（2文字ずつに分割した部分文字列検索用のサブフィールド）に対して行う。
+# テンプレートのバージョン3以降で作成したインデックスが前提（既存のインデックスは batch/import_chatlogs.py --reindex-from で移行する）。
+EXACT_SEARCH_BIGRAM = os.getenv("EXACT_SEARCH_BIGRAM") == "1"
+# 投稿者名サジェスト用インデックスの再構築間隔（秒）
+AUTHOR_INDEX_TTL = float(os.getenv("AUTHOR_INDEX_TTL", "3600"))
+AUTHOR_INDEX_BATCH_SIZE = 10000 # composite aggregationの1ページあたりの件数
+AUTHOR_SUGGEST_MAX_LIMIT = 50
+# チャット量タイムラインのロールアップ（batch/build_timeline_rollups.pyが作成）
+TIMELINE_INDEX_NAME = os.getenv("TIMELINE_INDEX_NAME", "youtube-chat-timeline")
+TIMELINE_CACHE_SIZE = int(os.getenv("TIMELINE_CACHE_SIZE", "1000"))
+TIMELINE_CACHE_TTL = float(os.getenv("TIMELINE_CACHE_TTL", "3600"))
+# 動画一覧スナップショットの再読み込み間隔（秒）
+VIDEO_CATALOG_TTL = float(os.getenv("VIDEO_CATALOG_TTL", "300"))
+VIDEO_FETCH_BATCH_SIZE = 1000 # 動画一覧の読み込み時に1回で取得する件数
+MSEARCH_MAX_SEARCHES = 10 # /msearchで一度に実行できる検索の数
+CONTEXT_MAX_SIZE = 100 # /contextで前後それぞれに取得できる最大件数
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000")) # エクスポート時に1回で取得する件数
+# Elasticsearchへのコネクションプール設定
+ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", "32"))
+ES_KEEPALIVE_TIMEOUT = float(os.getenv("ES_KEEPALIVE_TIMEOUT", "60"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "10"))
+# 遅い検索のログ出力。Elasticsearchへの往復時間がこの値（ミリ秒）以上の検索を記録する。0以下で無効。
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "1000"))
+# 遅い検索のうち、profile: true で再実行してプロファイルを保存する割合（0〜1）
+SLOW_QUERY_PROFILE_RATE = float(os.getenv("SLOW_QUERY_PROFILE_RATE", "0"))
+SLOW_QUERY_PROFILE_PATH = os.getenv("SLOW_QUERY_PROFILE_PATH", "/tmp/utsulog-slow-query-profiles.ndjson")
+SLOW_QUERY_PROFILE_MAX_BYTES = int(os.getenv("SLOW_QUERY_PROFILE_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_PROFILE_BACKUPS = int(os.getenv("SLOW_QUERY_PROFILE_BACKUPS", "5"))
+# レスポンスのJSONシリアライザ。"orjson"を指定するとorjsonを使う（要インストール）。
+JSON_RESPONSE = os.getenv("JSON_RESPONSE", "json")
+# レスポンスの圧縮。"gzip"、または"br"（要brotli-asgi、非対応のクライアントにはgzip）を指定する。
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "off")
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1000")) # これより小さいレスポンスは圧縮しない
 
-from mangum import Mangum
+def select_json_response_class():
+    """
+    JSON_RESPONSEの設定に応じて、APIが使うJSONレスポンスのクラスを返す。
+    """
+    if JSON_RESPONSE != "orjson":
+        return JSONResponse
+    try:
+        import orjson
+    except ImportError:
+        print("orjsonがインストールされていないため、標準のJSONシリアライザを使用します。")
+        return JSONResponse
+
+    class ORJSONResponse(JSONResponse):
+        def render(self, content: Any) -> bytes:
+            return orjson.dumps(content)
+
+    return ORJSONResponse
+
+JSON_RESPONSE_CLASS = select_json_response_class()
+
+def json_response(content: Any, **kwargs) -> Response:
+    """
+    JSONの値をそのままレスポンスにする。件数の多い検索結果などでFastAPIのjsonable_encoderによる
+    変換を省くために使う（値はdict/list/str/数値/bool/Noneのみで構成されている必要がある）。
+    """
+    return JSON_RESPONSE_CLASS(content=content, **kwargs)
+
+app = FastAPI(default_response_class=JSON_RESPONSE_CLASS)
+_mangum_handler = None
+
+def handler(event, context):
+    """
+    AWS Lambdaのエントリーポイント（main.handler）。
+    uvicornでの起動時には不要なmangumは、最初の呼び出し時にインポートする。
+    """
+    global _mangum_handler
+    if _mangum_handler is None:
+        from mangum import Mangum
+        _mangum_handler = Mangum(app)
+    return _mangum_handler(event, context)
+
+class KeepAliveAiohttpHttpNode(AiohttpHttpNode):
+    """
+    アイドル接続の保持時間（keep-alive）を設定できるようにしたaiohttpノード。
+    elastic-transport 8.19.0 の AiohttpHttpNode._create_aiohttp_session に keepalive_timeout を加えたもの。
+    非公開のメソッドと属性に依存するため、requirements.txtでバージョンを固定し、更新時はこのメソッドも合わせる。
+    """
+    def _create_aiohttp_session(self) -> None:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            skip_auto_headers=("accept", "accept-encoding", "user-agent"),
+            auto_decompress=True,
+            loop=self._loop,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            connector=aiohttp.TCPConnector(
+                limit_per_host=self._connections_per_node,
+                keepalive_timeout=ES_KEEPALIVE_TIMEOUT,
+                use_dns_cache=True,
+                enable_cleanup_closed=_NEEDS_CLEANUP_CLOSED,
+                ssl=self._ssl_context or False,
+            ),
+        )
+
+def create_es_client():
+    """
+    コネクションプールを設定したAsyncElasticsearchクライアントを生成する。
+    """
+    es_options = {
+        "api_key": ELASTICSEARCH_API_KEY,
+        "node_class": KeepAliveAiohttpHttpNode,
+        "connections_per_node": ES_CONNECTIONS_PER_NODE,
+        "request_timeout": ES_REQUEST_TIMEOUT,
+    }
+    if CF_CLIENT_ID:
+        es_options["headers"] = {
+            "CF-Access-Client-Id": CF_CLIENT_ID,
+            "CF-Access-Client-Secret": CF_CLIENT_SECRET
+        }
+    return AsyncElasticsearch(ELASTICSEARCH_HOST, **es_options)
 
-app = FastAPI()
-handler = Mangum(app)
 # Elasticsearchに接続
-if CF_CLIENT_ID:
-    es = Elasticsearch(ELASTICSEARCH_HOST, api_key=ELASTICSEARCH_API_KEY,headers={
-        "CF-Access-Client-Id": CF_CLIENT_ID,
-        "CF-Access-Client-Secret": CF_CLIENT_SECRET
-    })
-else:
-    es = Elasticsearch(ELASTICSEARCH_HOST, api_key=ELASTICSEARCH_API_KEY)
+# elasticsearch/aiohttpのインポートとクライアントの生成を最初のリクエストまで遅らせても、
+# Lambdaの最初のリクエストはほぼ必ずElasticsearchを使うため、コールドスタートの合計は短くならない
+# （measure_cold_start.py --baseline で計測）。そのためインポート時に生成する。
+_es_client = create_es_client()
+
+def get_es():
+    """
+    Elasticsearchクライアントを返す。
+    """
+    return _es_client
+
+def is_not_found(e: Exception) -> bool:
+    """
+    Elasticsearchの404エラー（NotFoundError）かどうかを判定する。
+    例外のメタ情報のHTTPステータスで判定する。
+    """
+    meta = getattr(e, "meta", None)
+    return getattr(meta, "status", None) == 404
 
 def calculate_thumbnail_url(video_id: str, elapsed_time: str) -> str:
     """
@@ -78,9 +269,379 @@ def calculate_author_icon_url(author_channel_id: str) -> str:
         return ""
     return f"{AUTHOR_ICON_BASE_URL}/{author_channel_id}.webp"
 
+class TTLCache:
+    """
+    件数上限（LRU）と有効期限（TTL）付きのスレッドセーフなインメモリキャッシュ。
+    sizeofを指定すると値のおおよそのバイト数を集計し、maxbytesを超えた分を古い順に追い出す。
+    stale_ttlを指定すると、有効期限切れの値もその秒数の間はget_staleで取得できる。
+    """
+    _MISSING = object()
+
+    def __init__(self, maxsize: int, ttl: float, maxbytes: Optional[int] = None, sizeof=None, stale_ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.nbytes = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is self._MISSING or entry[0] < time.monotonic():
+                if entry is not self._MISSING and entry[0] + self.stale_ttl < time.monotonic():
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, key, default=None):
+        """
+        有効期限切れからstale_ttl秒以内の値を返す。有効期限内の値や、存在しない場合はdefaultを返す。
+        """
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            now = time.monotonic()
+            if entry is self._MISSING or entry[0] >= now or entry[0] + self.stale_ttl < now:
+                return default
+            self.stale_hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, value, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes and self.nbytes > self.maxbytes and len(self._data) > 1):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self.nbytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        ヒット率やメモリ使用量などの統計情報を返す。
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.nbytes,
+            "maxbytes": self.maxbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "staleHits": self.stale_hits,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+class IndexGeneration:
+    """
+    バッチのインポート完了時に更新される世代マーカーを監視する。
+    世代が変わったら登録されたコールバック（キャッシュの破棄など）を呼び出す。
+    """
+    def __init__(self, index_name: str, interval: float):
+        self.index_name = index_name
+        self.interval = interval
+        self.value = None
+        self._loaded = False
+        self._checked_at = 0.0
+        self._callbacks = []
+
+    def on_change(self, callback):
+        self._callbacks.append(callback)
+
+    async def check(self, es):
+        """
+        前回の確認からinterval秒以上経過していれば世代マーカーを読み直す。
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.interval:
+            return self.value
+        self._checked_at = now
+        try:
+            doc = await es.get(index=META_INDEX_NAME, id=self.index_name)
+            generation = doc["_source"].get("generation")
+        except Exception as e:
+            if not is_not_found(e):
+                print(f"Error checking index generation for '{self.index_name}': {e}")
+                return self.value
+            # まだ一度もインポートが記録されていない
+            generation = None
+
+        if generation != self.value or not self._loaded:
+            previous = self.value
+            self.value = generation
+            if self._loaded:
+                print(f"Index generation changed for '{self.index_name}': {previous} -> {generation}")
+                for callback in self._callbacks:
+                    callback()
+            self._loaded = True
+        return self.value
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中であれば新たに実行せず、実行中の処理の結果（または例外）を共有する。
+    処理は独立したタスクとして実行するため、最初の呼び出し元が切断されても他の待機者には影響しない。
+    """
+    def __init__(self):
+        self._tasks: Dict[Any, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def start(self, key, func) -> asyncio.Task:
+        """
+        keyの処理が実行中でなければfunc()をバックグラウンドで開始し、実行中のタスクを返す。
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.shared += 1
+        return task
+
+    async def do(self, key, func):
+        return await asyncio.shield(self.start(key, func))
+
+    def _finish(self, key, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 誰も結果を待っていない場合（バックグラウンドでの再取得）に未取得の例外として警告されないよう、
+        # ここで例外を取得済みにする。エラーの記録は各処理の中で行う。
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inFlight": len(self._tasks),
+            "calls": self.calls,
+            "shared": self.shared,
+        }
+
+def format_metric_labels(labelnames, values) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Counter:
+    """
+    Prometheusのcounterに相当する、ラベルごとの累積値。
+    値の更新はイベントループのスレッドからのみ行うため、ロックは使わない。
+    """
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{format_metric_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    """
+    Prometheusのhistogramに相当する、ラベルごとのバケット別件数・合計・件数。
+    観測時はバケットの位置を二分探索して1つだけ加算し、累積値は出力時に計算する。
+    """
+    def __init__(self, name: str, help: str, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = list(buckets)
+        self.labelnames = labelnames
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            # [各バケットの件数（最後は+Inf）, 合計, 件数]
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += bucket_count
+                bucket_labels = format_metric_labels(self.labelnames + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_str = format_metric_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+http_requests_total = Counter(
+    "utsulog_http_requests_total", "HTTP requests by endpoint and status.", ("endpoint", "method", "status")
+)
+http_request_duration = Histogram(
+    "utsulog_http_request_duration_seconds", "Time from request to the last response byte.", LATENCY_BUCKETS, ("endpoint",)
+)
+http_response_size = Histogram(
+    "utsulog_http_response_size_bytes", "Response body size as sent (after compression).", SIZE_BUCKETS, ("endpoint",)
+)
+es_request_duration = Histogram(
+    "utsulog_es_request_duration_seconds", "Elasticsearch round-trip time seen by the API.", LATENCY_BUCKETS, ("endpoint",)
+)
+es_took = Histogram(
+    "utsulog_es_took_seconds", "Elasticsearch-reported execution time (took).", LATENCY_BUCKETS, ("endpoint",)
+)
+author_resolutions_total = Counter(
+    "utsulog_author_resolutions_total", "Author name to channel ID resolutions by source.", ("source",)
+)
+author_aggregation_duration = Histogram(
+    "utsulog_author_aggregation_duration_seconds", "Time spent in the author name aggregation.", LATENCY_BUCKETS
+)
+partial_searches_total = Counter(
+    "utsulog_partial_searches_total", "Searches cut short by their time budget.", ("endpoint", "query_class")
+)
+slow_queries_total = Counter(
+    "utsulog_slow_queries_total", "Searches slower than SLOW_QUERY_THRESHOLD_MS.", ("endpoint",)
+)
+
+def observe_es_response(endpoint: str, started: float, response: Dict[str, Any]) -> float:
+    """
+    Elasticsearchへのリクエストの往復時間と、レスポンスのtook（ES内部での実行時間）を記録し、往復時間（秒）を返す。
+    両者の差がネットワークとシリアライズにかかった時間になる。
+    """
+    elapsed = time.perf_counter() - started
+    es_request_duration.observe(elapsed, endpoint)
+    took = response.get("took")
+    if took is not None:
+        es_took.observe(took / 1000, endpoint)
+    return elapsed
+
+class MetricsMiddleware:
+    """
+    リクエストごとの件数・処理時間・レスポンスサイズを記録するASGIミドルウェア。
+    エンドポイントはパスではなくルートのテンプレート（/videos/{video_id}/timeline など）で集計する。
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            http_requests_total.inc(endpoint, scope["method"], status)
+            http_request_duration.observe(time.perf_counter() - started, endpoint)
+            http_response_size.observe(size, endpoint)
+
+def json_sizeof(value) -> int:
+    """
+    キャッシュする値のおおよそのメモリ使用量として、JSONにした際のバイト数を返す。
+    """
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+author_channel_cache = TTLCache(AUTHOR_CACHE_SIZE, AUTHOR_CACHE_TTL)
+search_result_cache = TTLCache(
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, maxbytes=SEARCH_CACHE_MAX_BYTES, sizeof=json_sizeof, stale_ttl=SEARCH_CACHE_STALE_TTL
+)
+search_flight = SingleFlight()
+author_flight = SingleFlight()
+count_cache = TTLCache(COUNT_CACHE_SIZE, COUNT_CACHE_TTL)
+chat_logs_generation = IndexGeneration(CHAT_LOGS_INDEX_NAME, GENERATION_CHECK_INTERVAL)
+chat_logs_generation.on_change(author_channel_cache.clear)
+chat_logs_generation.on_change(search_result_cache.clear)
+chat_logs_generation.on_change(count_cache.clear)
+
+async def prewarm_author_cache(es, size: int):
+    """
+    投稿数の多い投稿者から順に、名前 -> authorChannelId の対応をキャッシュに読み込む。
+    """
+    try:
+        response = await es.search(
+            index=CHAT_LOGS_INDEX_NAME,
+            size=0,
+            aggregations={
+                "authors": {
+                    "terms": {
+                        "field": "authorName.keyword",
+                        "size": size
+                    },
+                    "aggregations": {
+                        "channel_ids": {
+                            "terms": {
+                                "field": "authorChannelId.keyword",
+                                "size": 10
+                            }
+                        }
+                    }
+                }
+            }
+        )
+        buckets = response.get("aggregations", {}).get("authors", {}).get("buckets", [])
+        for bucket in buckets:
+            channel_ids = [b["key"] for b in bucket.get("channel_ids", {}).get("buckets", [])]
+            author_channel_cache.set(bucket["key"], channel_ids)
+        print(f"Prewarmed author cache with {len(buckets)} authors.")
+    except Exception as e:
+        print(f"Error prewarming author cache: {e}")
+
 @app.on_event("startup")
 async def startup_event():
-    app.state.es = es
+    # 常駐サーバーで投稿者キャッシュの事前読み込みが有効な場合のみ、起動時にElasticsearchへ接続する。
+    if AUTHOR_CACHE_PREWARM > 0:
+        await prewarm_author_cache(get_es(), AUTHOR_CACHE_PREWARM)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await _es_client.close()
 
 # CORSミドルウェアの設定
 app.add_middleware(
@@ -91,100 +652,726 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# レスポンス圧縮ミドルウェアの設定
+if RESPONSE_COMPRESSION == "br":
+    try:
+        from brotli_asgi import BrotliMiddleware
+        app.add_middleware(BrotliMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE, gzip_fallback=True)
+    except ImportError:
+        print("brotli-asgiがインストールされていないため、gzipで圧縮します。")
+        RESPONSE_COMPRESSION = "gzip"
+if RESPONSE_COMPRESSION == "gzip":
+    from starlette.middleware.gzip import GZipMiddleware
+    # 既定の圧縮レベル9はCPU時間の割にサイズがほとんど変わらないため6を使う
+    app.add_middleware(GZipMiddleware, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE, compresslevel=6)
+
+# メトリクスは圧縮後のサイズを記録するため、最も外側のミドルウェアとして追加する
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Utsulog API"}
 
-@app.get("/videos")
-def get_videos(request: Request):
+def extract_video_id(video_url: str) -> Optional[str]:
     """
-    Elasticsearchから動画のリストを取得するエンドポイント。
-    video_urlからvideoIdを抽出し、重複を除外する。
+    YouTubeのURLから 'v' パラメータ（videoId）を抽出する。
     """
-    es = request.app.state.es
-    if es is None:
-        raise HTTPException(status_code=503, detail="Elasticsearch service is unavailable.")
+    try:
+        parsed_url = urlparse(video_url)
+        return parse_qs(parsed_url.query).get('v', [None])[0]
+    except (KeyError, IndexError, ValueError):
+        return None
+
+async def iter_pit_batches(
+    es,
+    pit_id: str,
+    query: Dict[str, Any],
+    sort: List[Dict[str, Any]],
+    batch_size: int,
+    keep_alive: str,
+    **search_kwargs
+):
+    """
+    PIT + search_afterで検索結果の全件をbatch_size件ずつ読み出す非同期ジェネレーター。
+    一度に保持するのは1バッチ分のみ。読み出しが終わるか中断された時点でPITを解放する。
+    """
+    search_after = None
+    try:
+        while True:
+            page_kwargs = dict(search_kwargs)
+            if search_after is not None:
+                page_kwargs["search_after"] = search_after
+            response = await es.search(
+                pit={"id": pit_id, "keep_alive": keep_alive},
+                query=query,
+                sort=sort,
+                size=batch_size,
+                track_total_hits=False,
+                filter_path=["pit_id", "hits.hits._id", "hits.hits._source", "hits.hits.sort"],
+                **page_kwargs
+            )
+            pit_id = response.get("pit_id", pit_id)
+            hits = response.get("hits", {}).get("hits", [])
+            if hits:
+                yield hits
+            if len(hits) < batch_size:
+                break
+            search_after = hits[-1]["sort"]
+    finally:
+        try:
+            await es.close_point_in_time(id=pit_id)
+        except Exception as e:
+            print(f"Error closing point in time: {e}")
+
+class VideoCatalogSnapshot:
+    """
+    ある時点の動画一覧。videosはactualStartTimeの降順に並んでいる。
+    """
+    def __init__(self, videos: List[Dict[str, Any]]):
+        self.videos = videos
+        self.latest = videos[0].get("actualStartTime") if videos else None
+        # 全件レスポンスはスナップショットごとに1度だけシリアライズする
+        self.body = json.dumps({"videos": videos, "latest": self.latest}, ensure_ascii=False).encode("utf-8")
+        self.digest = hashlib.sha1(self.body).hexdigest()
+        self.etag = f'"{self.digest}"'
+        self.loaded_at = time.monotonic()
+
+class VideoCatalog:
+    """
+    動画一覧をプロセス内に保持する。TTLが切れたか、videosインデックスの世代が変わった場合は
+    古いスナップショットを返しつつバックグラウンドで再読み込みする。
+    読み込みは同時に1つだけ実行し、その間のリクエストは同じ読み込みの結果を待つ。
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.snapshot = None
+        self._stale = False
+        self.flight = SingleFlight()
+
+    def invalidate(self):
+        self._stale = True
 
-    search_query = {
-        "query": {
-            "match_all": {}
+    async def load(self, es) -> VideoCatalogSnapshot:
+        """
+        videosインデックスの全件をPIT + search_afterで読み込み、スナップショットを差し替える。
+        """
+        videos = []
+        seen = set()
+        pit_id = (await es.open_point_in_time(index=VIDEOS_INDEX_NAME, keep_alive="1m"))["id"]
+        batches = iter_pit_batches(
+            es,
+            pit_id,
+            query={"match_all": {}},
+            sort=[{"_shard_doc": "asc"}],
+            batch_size=VIDEO_FETCH_BATCH_SIZE,
+            keep_alive="1m",
+            source_includes=["video_url", "title", "thumbnail_url", "actualStartTime"],
+        )
+        async for hits in batches:
+            for hit in hits:
+                source = hit["_source"]
+                video_url = source.get("video_url")
+                if not video_url:
+                    continue
+                video_id = extract_video_id(video_url)
+                if not video_id or video_id in seen:
+                    continue
+                seen.add(video_id)
+                videos.append({
+                    "videoId": video_id,
+                    "title": source.get("title"),
+                    "thumbnail_url": source.get("thumbnail_url"),
+                    "actualStartTime": source.get("actualStartTime"),
+                })
+
+        # actualStartTimeは YYYYMMDDHHMMSS 形式の文字列なので、文字列比較で時系列順になる
+        videos.sort(key=lambda v: v.get("actualStartTime") or "", reverse=True)
+        snapshot = VideoCatalogSnapshot(videos)
+        self.snapshot = snapshot
+        self._stale = False
+        print(f"Loaded video catalog: {len(videos)} videos.")
+        return snapshot
+
+    async def _refresh_in_background(self, es):
+        try:
+            await self.load(es)
+        except Exception as e:
+            # 再読み込みに失敗しても、次のTTL切れまで古いスナップショットを返し続ける
+            print(f"動画リストの再読み込み中にエラーが発生しました: {e}")
+
+    async def get(self, es) -> VideoCatalogSnapshot:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return await self.flight.do("load", lambda: self.load(es))
+
+        if self._stale or time.monotonic() - snapshot.loaded_at > self.ttl:
+            self.flight.start("refresh", lambda: self._refresh_in_background(es))
+        return snapshot
+
+video_catalog = VideoCatalog(VIDEO_CATALOG_TTL)
+videos_generation = IndexGeneration(VIDEOS_INDEX_NAME, GENERATION_CHECK_INTERVAL)
+videos_generation.on_change(video_catalog.invalidate)
+timeline_cache = TTLCache(TIMELINE_CACHE_SIZE, TIMELINE_CACHE_TTL, sizeof=json_sizeof)
+timeline_generation = IndexGeneration(TIMELINE_INDEX_NAME, GENERATION_CHECK_INTERVAL)
+timeline_generation.on_change(timeline_cache.clear)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Matchヘッダーに指定されたETagのいずれかが一致するか判定する。
+    """
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    インメモリキャッシュのヒット率・メモリ使用量などを返すエンドポイント。
+    """
+    snapshot = video_catalog.snapshot
+    return {
+        "generation": {
+            "chatLogs": chat_logs_generation.value,
+            "videos": videos_generation.value,
+            "timeline": timeline_generation.value,
         },
-        "sort": [
-            {
-                "actualStartTime.keyword": {
-                    "order": "desc"
-                }
-            }
-        ],
-        "size": 1000 # 取得する動画の最大数
+        "searchResults": search_result_cache.stats(),
+        "counts": count_cache.stats(),
+        "singleFlight": {
+            "search": search_flight.stats(),
+            "authorChannels": author_flight.stats(),
+            "videoCatalog": video_catalog.flight.stats(),
+        },
+        "authorChannels": author_channel_cache.stats(),
+        "timeline": timeline_cache.stats(),
+        "authorIndex": {
+            "authors": len(author_index.entries),
+            "keys": len(author_index.keys),
+        },
+        "videoCatalog": {
+            "videos": len(snapshot.videos) if snapshot else 0,
+            "bytes": len(snapshot.body) if snapshot else 0,
+        },
+    }
+
+def cache_metric_lines() -> List[str]:
+    """
+    インメモリキャッシュの統計をPrometheusのテキスト形式にする。
+    """
+    caches = {
+        "search_results": search_result_cache,
+        "counts": count_cache,
+        "author_channels": author_channel_cache,
+        "timeline": timeline_cache,
+    }
+    metrics = [
+        ("utsulog_cache_hits_total", "counter", "Cache hits.", "hits"),
+        ("utsulog_cache_misses_total", "counter", "Cache misses.", "misses"),
+        ("utsulog_cache_stale_hits_total", "counter", "Expired entries served while revalidating.", "staleHits"),
+        ("utsulog_cache_evictions_total", "counter", "Entries evicted by size or byte limits.", "evictions"),
+        ("utsulog_cache_hit_ratio", "gauge", "Hits divided by lookups since start.", "hitRatio"),
+        ("utsulog_cache_entries", "gauge", "Entries currently cached.", "entries"),
+        ("utsulog_cache_bytes", "gauge", "Approximate bytes currently cached.", "bytes"),
+    ]
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    lines = []
+    for metric, metric_type, help_text, key in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for name, cache_stats in stats.items():
+            lines.append(f'{metric}{{cache="{name}"}} {cache_stats[key]}')
+    return lines
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheusのテキスト形式でメトリクスを返すエンドポイント。
+    値はプロセスごとに集計される（Lambdaの場合は実行環境ごと）。
+    """
+    lines = []
+    for metric in (
+        http_requests_total,
+        http_request_duration,
+        http_response_size,
+        es_request_duration,
+        es_took,
+        author_resolutions_total,
+        author_aggregation_duration,
+        slow_queries_total,
+        partial_searches_total,
+    ):
+        lines.extend(metric.render())
+    lines.extend(cache_metric_lines())
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/videos")
+async def get_videos(request: Request, since: Optional[str] = None):
+    """
+    動画のリストを返すエンドポイント。
+    プロセス内に保持した動画一覧のスナップショットを返し、ETagによる304応答に対応する。
+    since（actualStartTime, YYYYMMDDHHMMSS形式）を指定すると、それより新しい動画のみを返す。
+    レスポンスの latest を次回の since に使うことで差分のみを取得できる。
+    """
+    es = get_es()
+
+    await videos_generation.check(es)
+    try:
+        snapshot = await video_catalog.get(es)
+    except Exception as e:
+        print(f"動画リストの取得中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=500, detail="動画リストの取得中にエラーが発生しました。")
+
+    if since:
+        etag = f'"{snapshot.digest}-{hashlib.sha1(since.encode("utf-8")).hexdigest()[:16]}"'
+    else:
+        etag = snapshot.etag
+    # ブラウザに毎回ETagで再検証させる
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if not since:
+        return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+    # videosは降順なので、since以前の動画が現れた時点で打ち切れる
+    videos = []
+    for video in snapshot.videos:
+        if (video.get("actualStartTime") or "") <= since:
+            break
+        videos.append(video)
+    return json_response({"videos": videos, "latest": snapshot.latest}, headers=headers)
+
+def rebucket_timeline(video_id: str, rollup: Dict[str, Any], bucket_seconds: int) -> Dict[str, Any]:
+    """
+    ロールアップ（列形式、bucketSeconds単位）をbucket_seconds単位に再集計し、
+    メッセージのない区間も0件として埋めたバケットのリストにする。
+    """
+    columns = rollup.get("buckets", {})
+    counts = {}
+    for offset, total, superchat, transcript in zip(
+        columns.get("offsets", []),
+        columns.get("total", []),
+        columns.get("superchat", []),
+        columns.get("transcript", []),
+    ):
+        key = (offset // bucket_seconds) * bucket_seconds
+        bucket = counts.setdefault(key, [0, 0, 0])
+        bucket[0] += total
+        bucket[1] += superchat
+        bucket[2] += transcript
+
+    buckets = []
+    if counts:
+        for offset in range(min(counts), max(counts) + bucket_seconds, bucket_seconds):
+            total, superchat, transcript = counts.get(offset, (0, 0, 0))
+            buckets.append({
+                "offset": offset,
+                "total": total,
+                "superchat": superchat,
+                "transcript": transcript,
+                "thumbnailUrl": calculate_thumbnail_url(video_id, str(offset)),
+            })
+    return {
+        "videoId": video_id,
+        "bucketSeconds": bucket_seconds,
+        "startTimestamp": rollup.get("startTimestamp"),
+        "total": rollup.get("total", 0),
+        "buckets": buckets,
     }
 
+@app.get("/videos/{video_id}/timeline")
+async def get_video_timeline(video_id: str, bucket: int = 60):
+    """
+    動画内のチャット量の推移（配信開始からの経過秒 offset ごとのメッセージ数）を返すエンドポイント。
+    バッチで事前集計したロールアップを読み、bucket秒単位（ロールアップの集計単位の倍数）にまとめて返す。
+    """
+    es = get_es()
+    await timeline_generation.check(es)
+
+    cache_key = (video_id, bucket)
+    cached = timeline_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        response = es.search(
-            index=VIDEOS_INDEX_NAME, 
-            query=search_query["query"],
-            sort=search_query["sort"],
-            size=search_query["size"]
+        response = await es.search(
+            index=TIMELINE_INDEX_NAME,
+            query={"ids": {"values": [video_id]}},
+            size=1,
+            track_total_hits=False,
+            filter_path=["hits.hits._source"],
         )
-        
-        videos = []
-        for hit in response["hits"]["hits"]:
-            source = hit["_source"]
-            video_url = source.get("video_url")
-            if not video_url:
-                continue
-            
+    except Exception as e:
+        # build_timeline_rollups.py が一度も実行されていない場合はインデックス自体が存在しない
+        if is_not_found(e):
+            raise HTTPException(status_code=404, detail="この動画のタイムラインはまだ集計されていません。")
+        print(f"タイムラインの取得中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=500, detail="タイムラインの取得中にエラーが発生しました。")
+
+    hits = response.get("hits", {}).get("hits", [])
+    if not hits:
+        raise HTTPException(status_code=404, detail="この動画のタイムラインはまだ集計されていません。")
+    rollup = hits[0]["_source"]
+    base_seconds = rollup.get("bucketSeconds", 60)
+    if bucket <= 0 or bucket % base_seconds != 0:
+        raise HTTPException(status_code=400, detail=f"bucketには{base_seconds}の倍数を指定してください。")
+
+    result = rebucket_timeline(video_id, rollup, bucket)
+    timeline_cache.set(cache_key, result)
+    return result
+
+def normalize_author_key(name: str) -> str:
+    """
+    サジェストの照合用に、全角/半角や大文字/小文字の違いを吸収する。
+    """
+    return unicodedata.normalize("NFKC", name).casefold()
+
+class AuthorPrefixIndex:
+    """
+    全投稿者名とauthorChannelIdを、正規化した名前のソート済み配列として保持する。
+    前方一致検索は bisect で範囲を求めるだけなので、Elasticsearchに問い合わせずに応答できる。
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.keys = []
+        self.refs = []
+        self.entries = []
+        self.by_name = {}
+        self.loaded_at = None
+        self._stale = False
+        self._refresh_task = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._stale = True
+
+    async def load(self, es):
+        """
+        投稿者インデックスから全投稿者を読み込み、配列を作り直す。
+        投稿者インデックスが無効・未作成・空の場合は、チャットログの集計から読み込む。
+        """
+        authors = None
+        if AUTHORS_INDEX_NAME:
             try:
-                parsed_url = urlparse(video_url)
-                # YouTubeのURLから 'v' パラメータを抽出
-                video_id = parse_qs(parsed_url.query).get('v', [None])[0]
-                if not video_id:
-                    continue
-            except (KeyError, IndexError):
-                continue
+                authors = await self._load_from_authors_index(es)
+            except Exception as e:
+                if not is_not_found(e):
+                    raise
+        if not authors:
+            authors = await self._load_from_chat_logs(es)
+        self._build(authors)
 
-            video = {
-                "videoId": video_id,
-                "title": source.get("title"),
-                "thumbnail_url": source.get("thumbnail_url"),
-                "actualStartTime": source.get("actualStartTime"),
+    async def _load_from_authors_index(self, es) -> Dict[str, Dict[str, Any]]:
+        """
+        投稿者インデックスをauthorChannelId順にsearch_afterで全件読み込み、名前ごとにまとめる。
+        """
+        authors = {}
+        search_after = None
+        while True:
+            response = await es.search(
+                index=AUTHORS_INDEX_NAME,
+                size=AUTHOR_INDEX_BATCH_SIZE,
+                sort=[{"authorChannelId": "asc"}],
+                source=["authorChannelId", "names", "messageCount"],
+                track_total_hits=False,
+                filter_path=["hits.hits._source", "hits.hits.sort"],
+                **({"search_after": search_after} if search_after else {})
+            )
+            hits = response.get("hits", {}).get("hits", [])
+            for hit in hits:
+                source = hit["_source"]
+                for name in source.get("names", []):
+                    entry = authors.setdefault(name, {"channelIds": [], "count": 0})
+                    entry["channelIds"].append(source["authorChannelId"])
+                    entry["count"] += source.get("messageCount", 0)
+            if len(hits) < AUTHOR_INDEX_BATCH_SIZE:
+                break
+            search_after = hits[-1]["sort"]
+        return authors
+
+    async def _load_from_chat_logs(self, es) -> Dict[str, Dict[str, Any]]:
+        """
+        composite aggregationで (authorName, authorChannelId) の組を全件読み込む。
+        """
+        authors = {}
+        after_key = None
+        while True:
+            composite = {
+                "size": AUTHOR_INDEX_BATCH_SIZE,
+                "sources": [
+                    {"name": {"terms": {"field": "authorName.keyword"}}},
+                    {"channel": {"terms": {"field": "authorChannelId.keyword"}}},
+                ],
             }
-            videos.append(video)
-            
-        return {"videos": videos}
+            if after_key:
+                composite["after"] = after_key
+            response = await es.search(
+                index=CHAT_LOGS_INDEX_NAME,
+                size=0,
+                aggregations={"authors": {"composite": composite}},
+                filter_path=["aggregations.authors.after_key", "aggregations.authors.buckets"],
+            )
+            agg = response.get("aggregations", {}).get("authors", {})
+            for bucket in agg.get("buckets", []):
+                entry = authors.setdefault(bucket["key"]["name"], {"channelIds": [], "count": 0})
+                entry["channelIds"].append(bucket["key"]["channel"])
+                entry["count"] += bucket["doc_count"]
+            after_key = agg.get("after_key")
+            if not after_key or len(agg.get("buckets", [])) < AUTHOR_INDEX_BATCH_SIZE:
+                break
+        return authors
+
+    def _build(self, authors: Dict[str, Dict[str, Any]]):
+        entries = [
+            {"name": name, "channelIds": entry["channelIds"], "count": entry["count"]}
+            for name, entry in authors.items()
+        ]
+        pairs = []
+        for i, entry in enumerate(entries):
+            key = normalize_author_key(entry["name"])
+            pairs.append((key, i))
+            # ハンドル名（@xxx）は @ を省いた入力でも見つかるようにする
+            if key.startswith("@"):
+                pairs.append((key[1:], i))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.refs = [i for _, i in pairs]
+        self.entries = entries
+        self.by_name = {entry["name"]: entry for entry in entries}
+        self.loaded_at = time.monotonic()
+        self._stale = False
+        print(f"Loaded author index: {len(entries)} authors.")
 
+    async def _refresh_in_background(self, es):
+        try:
+            async with self._lock:
+                await self.load(es)
+        except Exception as e:
+            print(f"投稿者インデックスの再読み込み中にエラーが発生しました: {e}")
+
+    async def ensure_loaded(self, es):
+        """
+        未読み込みなら読み込みを待ち、古くなっていればバックグラウンドで再読み込みする。
+        """
+        if self.loaded_at is None:
+            async with self._lock:
+                if self.loaded_at is None:
+                    await self.load(es)
+            return
+        if self._stale or time.monotonic() - self.loaded_at > self.ttl:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh_in_background(es))
+
+    def lookup(self, name: str) -> Optional[List[str]]:
+        """
+        名前が完全一致する投稿者のauthorChannelIdのリストを返す。読み込み前や未知の名前はNone。
+        """
+        entry = self.by_name.get(name)
+        return entry["channelIds"] if entry else None
+
+    def suggest(self, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        正規化した名前がprefixで始まる投稿者を、名前順に最大limit件返す。
+        """
+        key = normalize_author_key(prefix)
+        start = bisect.bisect_left(self.keys, key)
+        results = []
+        seen = set()
+        for i in range(start, len(self.keys)):
+            if not self.keys[i].startswith(key) or len(results) >= limit:
+                break
+            ref = self.refs[i]
+            if ref in seen:
+                continue
+            seen.add(ref)
+            results.append(self.entries[ref])
+        return results
+
+author_index = AuthorPrefixIndex(AUTHOR_INDEX_TTL)
+chat_logs_generation.on_change(author_index.invalidate)
+
+async def lookup_authors_index(es, author_name: str) -> Optional[List[str]]:
+    """
+    投稿者インデックスから、namesにauthor_nameを含む投稿者のauthorChannelIdのリストを取得する。
+    投稿者インデックスが無効・未作成の場合やエラー時はNoneを返す。
+    """
+    if not AUTHORS_INDEX_NAME:
+        return None
+    try:
+        response = await es.search(
+            index=AUTHORS_INDEX_NAME,
+            query={"term": {"names": author_name}},
+            size=AUTHORS_LOOKUP_SIZE,
+            source=False,
+            track_total_hits=False,
+            filter_path=["hits.hits._id"],
+        )
     except Exception as e:
-        print(f"動画リストの取得中にエラーが発生しました: {e}")
-        raise HTTPException(status_code=500, detail="動画リストの取得中にエラーが発生しました。")
+        if not is_not_found(e):
+            print(f"投稿者インデックスの検索中にエラーが発生しました: {e}")
+        return None
+    return [hit["_id"] for hit in response.get("hits", {}).get("hits", [])]
 
-@app.get("/search")
-def search_chat_logs(
-    q: str = "", 
-    from_: int = 0, 
-    exact: bool = False, 
+async def resolve_author_channel_ids(es, author_name: str) -> Optional[List[str]]:
+    """
+    投稿者名から、その名前で投稿したことのあるauthorChannelIdのリストを取得する。
+    結果はキャッシュされ、エラー時はNoneを返す（キャッシュしない）。
+    """
+    channel_ids = author_channel_cache.get(author_name)
+    if channel_ids is not None:
+        author_resolutions_total.inc("cache")
+        return channel_ids
+
+    # サジェスト用インデックスが読み込み済みで名前が登録されていれば、集計は不要
+    channel_ids = author_index.lookup(author_name)
+    if channel_ids is not None:
+        author_resolutions_total.inc("index")
+        author_channel_cache.set(author_name, channel_ids)
+        return channel_ids
+
+    # 投稿者インデックスに登録されていれば、1回の検索で解決できる
+    channel_ids = await lookup_authors_index(es, author_name)
+    if channel_ids:
+        author_resolutions_total.inc("authors")
+        author_channel_cache.set(author_name, channel_ids)
+        return channel_ids
+
+    # author_nameからauthorChannelIdを特定するためのAggregationクエリ
+    # 同一人物が異なる名前（表示名とハンドル名など）で保存されている場合でも、
+    # authorChannelIdを通じて全て取得できるようにする。
+    # 同じ投稿者名の集計が実行中であれば、その結果を共有する
+    started = time.perf_counter()
+    try:
+        agg_response = await author_flight.do(author_name, lambda: es.search(
+            index=CHAT_LOGS_INDEX_NAME,
+            size=0,
+            query={
+                "term": {
+                    "authorName.keyword": author_name
+                }
+            },
+            aggregations={
+                "channel_ids": {
+                    "terms": {
+                        "field": "authorChannelId.keyword",
+                        "size": 10
+                    }
+                }
+            }
+        ))
+    except Exception as e:
+        author_resolutions_total.inc("error")
+        print(f"Error during author aggregation: {e}")
+        return None
+    finally:
+        author_aggregation_duration.observe(time.perf_counter() - started)
+    author_resolutions_total.inc("aggregation")
+
+    buckets = agg_response.get("aggregations", {}).get("channel_ids", {}).get("buckets", [])
+    channel_ids = [b["key"] for b in buckets]
+    author_channel_cache.set(author_name, channel_ids)
+    return channel_ids
+
+def date_range_millis(date_from: Optional[str], date_to: Optional[str]):
+    """
+    date_from / date_to をtimestamp（ミリ秒）の範囲 [ts_from, ts_to) に変換する。
+    未指定や不正な日付形式の場合、その側はNoneになる。
+    """
+    ts_from = ts_to = None
+    if date_from:
+        try:
+            ts_from = int(datetime.fromisoformat(date_from).timestamp() * 1000)
+        except ValueError:
+            pass # 不正な日付形式は無視
+    if date_to:
+        try:
+            # 指定日の終わりまで含めるため、次の日の0時より小さい範囲を指定
+            dt_to = datetime.fromisoformat(date_to) + timedelta(days=1)
+            ts_to = int(dt_to.timestamp() * 1000)
+        except ValueError:
+            pass # 不正な日付形式は無視
+    return ts_from, ts_to
+
+def chat_logs_partition_name(year: int, month: int) -> str:
+    """
+    年月に対応するパーティションのインデックス名を返す（batch/import_chatlogs.pyと同じ規則、UTC基準）。
+    """
+    if CHAT_LOGS_PARTITION == "quarter":
+        return f"{CHAT_LOGS_INDEX_NAME}-{year}.q{(month - 1) // 3 + 1}"
+    return f"{CHAT_LOGS_INDEX_NAME}-{year}.{month:02d}"
+
+def chat_logs_target(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    video_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    検索対象のインデックスとルーティングを、es.search などに渡すキーワード引数として返す。
+    期間パーティションが有効で日付範囲が指定されている場合は、範囲に重なるパーティションだけを対象にする。
+    まだ存在しないパーティションは ignore_unavailable で無視する。
+    videoIdでのルーティングが有効で動画IDが指定されている場合は、その動画のシャードだけを対象にする。
+    """
+    target = chat_logs_partitions_for(date_from, date_to)
+    if CHAT_LOGS_ROUTING == "videoId" and video_id:
+        target["routing"] = video_id
+    return target
+
+def chat_logs_partitions_for(date_from: Optional[str], date_to: Optional[str]) -> Dict[str, Any]:
+    if CHAT_LOGS_PARTITION not in ("month", "quarter"):
+        return {"index": CHAT_LOGS_INDEX_NAME}
+    ts_from, ts_to = date_range_millis(date_from, date_to)
+    if ts_from is None:
+        return {"index": CHAT_LOGS_INDEX_NAME}
+    if ts_to is None:
+        ts_to = int(time.time() * 1000) + 1
+    if ts_to <= ts_from:
+        return {"index": CHAT_LOGS_INDEX_NAME}
+
+    start = datetime.fromtimestamp(ts_from / 1000, tz=timezone.utc)
+    end = datetime.fromtimestamp((ts_to - 1) / 1000, tz=timezone.utc)
+    names = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        name = chat_logs_partition_name(year, month)
+        if name not in names:
+            names.append(name)
+        if len(names) > CHAT_LOGS_MAX_TARGET_PARTITIONS:
+            return {"index": CHAT_LOGS_INDEX_NAME}
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return {"index": ",".join(names), "ignore_unavailable": True}
+
+def exact_search_field(q: str) -> str:
+    """
+    完全一致検索の対象フィールドを返す。
+    message.bigram は2文字単位でしか引けないため、1文字の検索語は message（kuromoji）で検索する。
+    半角カナの濁点はインデックス時に合成されるため、文字数はNFKC正規化後で数える。
+    """
+    if EXACT_SEARCH_BIGRAM and len(unicodedata.normalize("NFKC", q.strip())) >= 2:
+        return "message.bigram"
+    return "message"
+
+async def build_search_query(
+    es,
+    q: str = "",
+    exact: bool = False,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     author_name: Optional[str] = None,
     video_id: Optional[str] = None,
     message_type: str = "all",
-    sort_order: str = "desc",
-    request: Request = None
-):
+) -> Dict[str, Any]:
     """
-    Elasticsearchを使用してチャットログを検索するエンドポイント。
-    ページネーション、完全一致検索、日付範囲フィルター、動画IDフィルターをサポート。
+    検索パラメータからElasticsearchのboolクエリを構築する。
     """
-    es = request.app.state.es
-    if es is None:
-        raise HTTPException(status_code=503, detail="Elasticsearch service is unavailable.")
-
     must_clauses = []
     # キーワード検索のクエリ部分
     if q:
         if exact:
             must_clauses.append({
                 "match_phrase": {
-                    "message": q
+                    exact_search_field(q): q
                 }
             })
         else:
@@ -197,58 +1384,19 @@ def search_chat_logs(
 
     # フィルターの部分
     filters = []
-    if date_from:
-        try:
-            dt_from = datetime.fromisoformat(date_from)
-            ts_from = int(dt_from.timestamp() * 1000)
-            filters.append({"range": {"timestamp": {"gte": ts_from}}})
-        except ValueError:
-            pass # 不正な日付形式は無視
-    if date_to:
-        try:
-            # 指定日の終わりまで含めるため、次の日の0時より小さい範囲を指定
-            dt_to = datetime.fromisoformat(date_to) + timedelta(days=1)
-            ts_to = int(dt_to.timestamp() * 1000)
-            filters.append({"range": {"timestamp": {"lt": ts_to}}})
-        except ValueError:
-            pass # 不正な日付形式は無視
+    ts_from, ts_to = date_range_millis(date_from, date_to)
+    if ts_from is not None:
+        filters.append({"range": {"timestamp": {"gte": ts_from}}})
+    if ts_to is not None:
+        filters.append({"range": {"timestamp": {"lt": ts_to}}})
 
     if author_name:
-        # author_nameからauthorChannelIdを特定するためのAggregationクエリ
-        # 同一人物が異なる名前（表示名とハンドル名など）で保存されている場合でも、
-        # authorChannelIdを通じて全て取得できるようにする。
-        try:
-            agg_response = es.search(
-                index=CHAT_LOGS_INDEX_NAME,
-                size=0,
-                query={
-                    "term": {
-                        "authorName.keyword": author_name
-                    }
-                },
-                aggregations={
-                    "channel_ids": {
-                        "terms": {
-                            "field": "authorChannelId.keyword",
-                            "size": 10
-                        }
-                    }
-                }
-            )
-            
-            buckets = agg_response.get("aggregations", {}).get("channel_ids", {}).get("buckets", [])
-            channel_ids = [b["key"] for b in buckets]
-            
-            if channel_ids:
-                # 特定されたIDのいずれかに一致すればOK
-                filters.append({"terms": {"authorChannelId.keyword": channel_ids}})
-            else:
-                # IDが見つからない場合は従来通り名前で検索
-                filters.append({"term": {"authorName.keyword": author_name}})
-                
-        except Exception as e:
-            print(f"Error during author aggregation: {e}")
-            # エラー時はフォールバックとして名前で検索
+        channel_ids = await resolve_author_channel_ids(es, author_name)
+        if channel_ids:
+            # 特定されたIDのいずれかに一致すればOK
+            filters.append({"terms": {"authorChannelId.keyword": channel_ids}})
+        else:
+            # IDが見つからない場合やエラー時は従来通り名前で検索
             filters.append({"term": {"authorName.keyword": author_name}})
 
     if video_id:
@@ -257,62 +1405,1010 @@ def search_chat_logs(
     if message_type and message_type != "all":
         filters.append({"term": {"type.keyword": message_type}})
 
-    # Elasticsearchの検索クエリ全体を構築
-    search_query = {
-        "from": from_,
-        "query": {
-            "bool": {
-                "must": must_clauses,
-                "filter": filters
+    return {
+        "bool": {
+            "must": must_clauses,
+            "filter": filters
+        }
+    }
+
+def encode_cursor(pit_id: str, search_after: List[Any], sort_order: str) -> str:
+    """
+    PIT IDとsearch_afterの値を、クライアントに返す不透明なカーソル文字列にエンコードする。
+    """
+    payload = json.dumps({"pit": pit_id, "after": search_after, "order": sort_order}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    encode_cursorで生成したカーソル文字列をデコードする。不正な場合は400エラーとする。
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not payload.get("pit") or not isinstance(payload.get("after"), list):
+            raise ValueError("missing fields")
+        return payload
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="不正なカーソルです。")
+
+# 検索結果の各フィールドと、その生成に必要な_sourceのフィールド
+SEARCH_RESULT_FIELDS = {
+    "id": [],
+    "videoId": ["videoId"],
+    "videoTitle": ["videoTitle"],
+    "datetime": ["datetime"],
+    "elapsedTime": ["elapsedTime"],
+    "timestampSec": ["timestamp"],
+    "message": ["message"],
+    "type": ["type"],
+    "author": ["authorName"],
+    "authorChannelId": ["authorChannelId"],
+    "authorIconUrl": ["authorChannelId"],
+    "thumbnailUrl": ["videoId", "elapsedTime"],
+}
+# 検索レスポンスのうち、APIが使用する部分だけをElasticsearchから受け取る
+SEARCH_FILTER_PATH = [
+    "took",
+    "timed_out",
+    "terminated_early",
+    "pit_id",
+    "hits.total",
+    "hits.hits._id",
+    "hits.hits._source",
+    "hits.hits.sort",
+]
+
+def parse_result_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    fieldsパラメータ（カンマ区切り）を検証してリストにする。未指定の場合はNone（全フィールド）。
+    """
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in SEARCH_RESULT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不明なフィールドが指定されました: {', '.join(unknown)}")
+    return requested or None
+
+def source_includes_for(result_fields: Optional[List[str]]) -> List[str]:
+    """
+    指定された結果フィールドを生成するのに必要な_sourceのフィールドを返す。
+    """
+    includes = []
+    for field in result_fields or SEARCH_RESULT_FIELDS:
+        for source_field in SEARCH_RESULT_FIELDS[field]:
+            if source_field not in includes:
+                includes.append(source_field)
+    return includes
+
+def format_search_hit(hit: Dict[str, Any], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Elasticsearchのヒットをフロントエンド向けの形式に整形する。
+    fieldsを指定した場合は、そのフィールドのみを返す。
+    """
+    source = hit.get("_source", {})
+    if fields is None:
+        return {
+            "id": hit["_id"],
+            "videoId": source.get("videoId"),
+            "videoTitle": source.get("videoTitle"),
+            "datetime": source.get("datetime"),
+            "elapsedTime": source.get("elapsedTime"),
+            "timestampSec": source.get("timestamp"),
+            "message": source.get("message"),
+            "type": source.get("type"),
+            "author": source.get("authorName"),
+            "authorChannelId": source.get("authorChannelId"),
+            "authorIconUrl": calculate_author_icon_url(source.get("authorChannelId")),
+            "thumbnailUrl": calculate_thumbnail_url(source.get("videoId"), source.get("elapsedTime")),
+        }
+
+    result = {}
+    for field in fields:
+        if field == "id":
+            result["id"] = hit["_id"]
+        elif field == "authorIconUrl":
+            result["authorIconUrl"] = calculate_author_icon_url(source.get("authorChannelId"))
+        elif field == "thumbnailUrl":
+            result["thumbnailUrl"] = calculate_thumbnail_url(source.get("videoId"), source.get("elapsedTime"))
+        else:
+            result[field] = source.get(SEARCH_RESULT_FIELDS[field][0])
+    return result
+
+def normalize_search_q(q: str, exact: bool) -> str:
+    """
+    検索語の表記ゆれ（前後や連続する空白）を正規化する。
+    完全一致検索では、message.bigramが空白も1文字として扱うため、語中の空白はそのまま残す。
+    キャッシュキーとクエリの両方にこの値を使い、空白だけの検索語は検索語なしとして扱う。
+    """
+    return q.strip() if exact else " ".join(q.split())
+
+def search_cache_key(
+    q: str,
+    exact: bool,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    author_name: Optional[str],
+    video_id: Optional[str],
+    message_type: str,
+    sort_order: str,
+    from_: int,
+    cursor: Optional[str],
+    fields: Optional[List[str]] = None,
+) -> str:
+    """
+    検索パラメータを正規化し、結果キャッシュのキーを生成する。
+    表記ゆれ（検索語の空白、日付の書式、既定値の省略）は同じキーになる。
+    検索語は normalize_search_q で正規化したものを渡す。
+    """
+    def normalize_date(value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value).isoformat()
+        except ValueError:
+            return None # 検索時と同様に不正な日付は無視
+
+    key = {
+        "q": normalize_search_q(q, exact),
+        "exact": bool(exact and q),
+        "from": normalize_date(date_from),
+        "to": normalize_date(date_to),
+        "author": author_name or None,
+        "video": video_id or None,
+        "type": None if not message_type or message_type == "all" else message_type,
+        "order": sort_order,
+        "page": cursor if cursor else from_,
+        "fields": fields,
+    }
+    return json.dumps(key, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+def count_cache_key(
+    q: str,
+    exact: bool,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    author_name: Optional[str],
+    video_id: Optional[str],
+    message_type: str,
+) -> str:
+    """
+    総ヒット件数のキャッシュキーを生成する。件数はソート順やページに依存しない。
+    """
+    return search_cache_key(q, exact, date_from, date_to, author_name, video_id, message_type, "", 0, None)
+
+def search_query_class(q: str, exact: bool) -> str:
+    """
+    時間予算を選ぶための検索の種類（keyword / exact / filter）を返す。
+    """
+    if not q:
+        return "filter"
+    return "exact" if exact else "keyword"
+
+def search_budget_kwargs(query_class: str) -> Dict[str, Any]:
+    """
+    検索の種類に応じた timeout / terminate_after をes.searchの引数として返す。
+    """
+    budget = SEARCH_BUDGETS[query_class]
+    kwargs = {}
+    if budget["timeout"]:
+        kwargs["timeout"] = budget["timeout"]
+    if budget["terminate_after"] > 0:
+        kwargs["terminate_after"] = budget["terminate_after"]
+    return kwargs
+
+def is_partial_response(response: Dict[str, Any]) -> bool:
+    """
+    時間予算（timeout / terminate_after）によって検索が打ち切られたかどうかを返す。
+    """
+    return bool(response.get("timed_out") or response.get("terminated_early"))
+
+def read_total_hits(hits_section: Dict[str, Any], count_key: str, partial: bool = False) -> Dict[str, Any]:
+    """
+    検索レスポンスの hits.total から {"total", "totalExact"} を作る。
+    件数が正確な場合は /count と共有するキャッシュに保存する。打ち切られた検索の件数は下限値として扱う。
+    """
+    total = hits_section.get("total")
+    if total is None:
+        return {"total": 0, "totalExact": False}
+    exact = total.get("relation", "eq") == "eq" and not partial
+    if exact:
+        count_cache.set(count_key, total.get("value", 0))
+    return {"total": total.get("value", 0), "totalExact": exact}
+
+def with_exact_total(result: Dict[str, Any], count_key: str) -> Dict[str, Any]:
+    """
+    件数が下限値の結果について、正確な件数がキャッシュにあれば置き換えたコピーを返す。
+    """
+    if result.get("totalExact"):
+        return result
+    exact_total = count_cache.get(count_key)
+    if exact_total is None:
+        return result
+    return {**result, "total": exact_total, "totalExact": True}
+
+# 値を伏せずに残すキー（フィールド名やソート順など、クエリの形を表すもの）
+QUERY_SHAPE_KEEP_KEYS = {"fields", "field", "order"}
+
+def query_shape(value: Any, key: Optional[str] = None) -> Any:
+    """
+    クエリの検索語や日付などの値を"?"に置き換え、同じ形のクエリを集計できるようにする。
+    """
+    if isinstance(value, dict):
+        return {k: query_shape(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [query_shape(v, key) for v in value]
+    if key in QUERY_SHAPE_KEEP_KEYS or isinstance(value, bool) or value is None:
+        return value
+    return "?"
+
+class SlowQueryLog:
+    """
+    Elasticsearchへの往復時間がしきい値を超えた検索をログに出力する。
+    そのうちsample_rateの割合の検索は、profile: true を付けてバックグラウンドで再実行し、
+    シャードごとのプロファイルをローテーションするローカルファイルにNDJSONで書き出す。
+    """
+    def __init__(self, threshold_ms: float, sample_rate: float, path: str, max_bytes: int, backups: int):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._logger = None
+        self._profile_task = None
+
+    def record(
+        self,
+        es,
+        endpoint: str,
+        params: Dict[str, Any],
+        elapsed: float,
+        response: Dict[str, Any],
+        search_kwargs: Dict[str, Any],
+    ):
+        """
+        検索1回分の結果を確認し、遅い場合はログを出力する。
+        search_kwargsには、プロファイル取得のために再実行する際のes.searchの引数
+        （検索対象のindexと、使っていればroutingを含む）を渡す。
+        """
+        elapsed_ms = elapsed * 1000
+        if self.threshold_ms <= 0 or elapsed_ms < self.threshold_ms:
+            return
+        slow_queries_total.inc(endpoint)
+        entry = {
+            "endpoint": endpoint,
+            "elapsedMs": round(elapsed_ms, 1),
+            "took": response.get("took"),
+            "timedOut": response.get("timed_out"),
+            "hits": response.get("hits", {}).get("total", {}).get("value"),
+            "params": params,
+            "queryShape": query_shape(search_kwargs.get("query")),
+            "sort": search_kwargs.get("sort"),
+        }
+        print(f"遅い検索を検出しました: {json.dumps(entry, ensure_ascii=False)}")
+
+        # プロファイルの取得自体も重いため、同時に実行するのは1件まで
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            if self._profile_task is None or self._profile_task.done():
+                self._profile_task = asyncio.create_task(self._capture_profile(es, entry, search_kwargs))
+
+    async def _capture_profile(self, es, entry: Dict[str, Any], search_kwargs: Dict[str, Any]):
+        try:
+            response = await es.search(
+                profile=True,
+                track_total_hits=SEARCH_TOTAL_HITS,
+                source=False,
+                filter_path=["took", "hits.total", "profile"],
+                **search_kwargs
+            )
+            record = {
+                **entry,
+                "capturedAt": datetime.now().isoformat(),
+                "query": search_kwargs.get("query"),
+                "profileTook": response.get("took"),
+                "profile": response.get("profile"),
             }
-        },
-        "sort": [
+            self._get_logger().info(json.dumps(record, ensure_ascii=False))
+        except Exception as e:
+            print(f"検索プロファイルの取得中にエラーが発生しました: {e}")
+
+    def _get_logger(self):
+        if self._logger is None:
+            import logging
+            from logging.handlers import RotatingFileHandler
+
+            logger = logging.getLogger("utsulog.slow_query_profile")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+slow_query_log = SlowQueryLog(
+    SLOW_QUERY_THRESHOLD_MS,
+    SLOW_QUERY_PROFILE_RATE,
+    SLOW_QUERY_PROFILE_PATH,
+    SLOW_QUERY_PROFILE_MAX_BYTES,
+    SLOW_QUERY_PROFILE_BACKUPS,
+)
+
+@app.get("/search")
+async def search_chat_logs(
+    q: str = "", 
+    from_: int = 0, 
+    exact: bool = False, 
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    author_name: Optional[str] = None,
+    video_id: Optional[str] = None,
+    message_type: str = "all",
+    sort_order: str = "desc",
+    paging: str = "offset",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    request: Request = None
+):
+    """
+    Elasticsearchを使用してチャットログを検索するエンドポイント。
+    ページネーション、完全一致検索、日付範囲フィルター、動画IDフィルターをサポート。
+
+    ページネーションは2種類:
+    - offset (既定): from_ で開始位置を指定する。深いページほど重くなり、max_result_windowを超えられない。
+    - cursor: paging=cursor で1ページ目を取得すると next_cursor が返る。以降は同じ検索条件に
+      cursor=next_cursor を付けて呼び出す。PIT + search_after により、どのページも1ページ目と同程度のコストで取得できる。
+
+    fields（カンマ区切り、例: fields=id,message,timestampSec）で返すフィールドを絞り込める。
+
+    total は SEARCH_TOTAL_HITS 件までしか数えないため、幅広い検索でもすぐに1ページ目を返せる。
+    totalExact が false の場合、total は下限値であり、正確な件数は /count で取得する。
+
+    検索の種類（キーワード / 完全一致 / 絞り込みのみ）ごとの時間予算を超えた場合は、
+    それまでに見つかった結果を partial: true を付けて返す（キャッシュはしない）。
+    cursorモードのページは続きを取りこぼさないよう、時間予算を適用しない。
+    """
+    es = get_es()
+
+    q = normalize_search_q(q, exact)
+    result_fields = parse_result_fields(fields)
+    cursor_state = decode_cursor(cursor) if cursor else None
+    use_cursor = cursor_state is not None or paging == "cursor"
+    if cursor_state:
+        # 途中でソート順が変わるとsearch_afterの値が意味を持たないため、カーソル作成時の順序を使う
+        sort_order = cursor_state.get("order", sort_order)
+
+    # 新しいインポートがあればキャッシュを破棄する
+    await chat_logs_generation.check(es)
+    count_key = count_cache_key(q, exact, date_from, date_to, author_name, video_id, message_type)
+
+    # cursorモードの1ページ目は新しいPITを作るため、キャッシュも同時実行の集約もしない。
+    # 2ページ目以降はPITが固定のスナップショットなので、同じカーソルなら結果も同じになる。
+    cache_key = None
+    if not (use_cursor and not cursor_state):
+        cache_key = search_cache_key(
+            q, exact, date_from, date_to, author_name, video_id, message_type, sort_order, from_, cursor,
+            result_fields
+        )
+        cached = search_result_cache.get(cache_key)
+        if cached is not None:
+            return json_response(with_exact_total(cached, count_key))
+
+    async def run_search() -> Dict[str, Any]:
+        sort = [
             {
                 "timestamp": {
                     "order": sort_order
                 }
             }
-        ],
-        "size": 100 # 1回あたりの取得件数
+        ]
+        # 必要なフィールドだけを_sourceから取得する（idのみの場合は_source自体を取得しない）
+        source_includes = source_includes_for(result_fields)
+        source_kwargs = {"source_includes": source_includes} if source_includes else {"source": False}
+        query_class = search_query_class(q, exact)
+        # cursorモードでは時間予算を適用しない。打ち切られたシャードは次のsearch_afterの位置より前の
+        # ドキュメントを集め終えていないため、続きのページでそれらを取りこぼしてしまう。
+        budget_kwargs = {} if use_cursor else search_budget_kwargs(query_class)
+
+        try:
+            # 投稿者名の解決とPITの作成は互いに独立しているため並行して実行する
+            query_task = build_search_query(
+                es,
+                q=q,
+                exact=exact,
+                date_from=date_from,
+                date_to=date_to,
+                author_name=author_name,
+                video_id=video_id,
+                message_type=message_type,
+            )
+            if use_cursor and not cursor_state:
+                query, pit = await asyncio.gather(
+                    query_task,
+                    es.open_point_in_time(keep_alive=PIT_KEEP_ALIVE, **chat_logs_target(date_from, date_to, video_id)),
+                )
+                pit_id = pit["id"]
+            else:
+                query = await query_task
+                pit_id = cursor_state["pit"] if cursor_state else None
+
+            if use_cursor:
+                # 同一timestampのドキュメントを取りこぼさないよう、_shard_docをタイブレーカーに使う
+                sort.append({"_shard_doc": {"order": sort_order}})
+                search_kwargs = {}
+                if cursor_state:
+                    search_kwargs["search_after"] = cursor_state["after"]
+                started = time.perf_counter()
+                response = await es.search(
+                    pit={"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+                    query=query,
+                    sort=sort,
+                    size=SEARCH_PAGE_SIZE,
+                    track_total_hits=SEARCH_TOTAL_HITS,
+                    filter_path=SEARCH_FILTER_PATH,
+                    **budget_kwargs,
+                    **source_kwargs,
+                    **search_kwargs
+                )
+            else:
+                started = time.perf_counter()
+                response = await es.search(
+                    from_=from_,
+                    query=query,
+                    sort=sort,
+                    size=SEARCH_PAGE_SIZE,
+                    track_total_hits=SEARCH_TOTAL_HITS,
+                    filter_path=SEARCH_FILTER_PATH,
+                    **budget_kwargs,
+                    **source_kwargs,
+                    **chat_logs_target(date_from, date_to, video_id)
+                )
+            elapsed = observe_es_response("/search", started, response)
+            # 遅い検索の調査用に、同じ検索をPITを使わずに再実行できる引数を渡す。
+            # 検索対象は元の検索と同じパーティション・ルーティングに絞る。
+            # _shard_docはPITでのみ使えるため、cursorモードではtimestampのみでsearch_afterする。
+            profile_kwargs = {
+                "query": query, "sort": sort[:1], "size": SEARCH_PAGE_SIZE,
+                **chat_logs_target(date_from, date_to, video_id),
+            }
+            if not use_cursor:
+                profile_kwargs["from_"] = from_
+            elif cursor_state:
+                profile_kwargs["search_after"] = cursor_state["after"][:1]
+            slow_query_log.record(
+                es,
+                "/search",
+                {
+                    "q": q,
+                    "exact": exact,
+                    "date_from": date_from,
+                    "date_to": date_to,
+                    "author_name": author_name,
+                    "video_id": video_id,
+                    "message_type": message_type,
+                    "sort_order": sort_order,
+                    "from_": from_,
+                    "paging": "cursor" if use_cursor else "offset",
+                },
+                elapsed,
+                response,
+                profile_kwargs,
+            )
+
+            partial = is_partial_response(response)
+            if partial:
+                partial_searches_total.inc("/search", query_class)
+
+            # 総ヒット件数を取得
+            # filter_pathを指定しているため、ヒットが0件の場合は hits.hits 自体が含まれない
+            hits_section = response.get("hits", {})
+            total = read_total_hits(hits_section, count_key, partial)
+        
+            # フロントエンド向けの形式にレスポンスを整形
+            hits = hits_section.get("hits", [])
+            results = [format_search_hit(hit, result_fields) for hit in hits]
+
+            if not use_cursor:
+                result = {**total, "partial": partial, "results": results}
+                if cache_key and SEARCH_CACHE_SIZE > 0 and not partial:
+                    search_result_cache.set(cache_key, result)
+                return result
+
+            # PIT IDは検索のたびに更新されることがあるため、レスポンスの値を引き継ぐ
+            pit_id = response.get("pit_id", pit_id)
+            next_cursor = None
+            if len(hits) == SEARCH_PAGE_SIZE:
+                next_cursor = encode_cursor(pit_id, hits[-1]["sort"], sort_order)
+            else:
+                # 最終ページに到達したらPITを解放する
+                try:
+                    await es.close_point_in_time(id=pit_id)
+                except Exception as e:
+                    print(f"Error closing point in time: {e}")
+            result = {**total, "partial": partial, "results": results, "next_cursor": next_cursor}
+            if cache_key and SEARCH_CACHE_SIZE > 0 and not partial:
+                search_result_cache.set(cache_key, result)
+            return result
+
+        except Exception as e:
+            if use_cursor and is_not_found(e):
+                # PITのkeep_aliveが切れた場合
+                print(f"カーソルの有効期限切れ: {e}")
+                raise HTTPException(status_code=410, detail="カーソルの有効期限が切れました。最初から検索し直してください。")
+            print(f"検索中にエラーが発生しました: {e}")
+            raise HTTPException(status_code=500, detail="検索処理中にエラーが発生しました。")
+
+    if cache_key is None:
+        result = await run_search()
+    else:
+        stale = search_result_cache.get_stale(cache_key)
+        if stale is not None:
+            # 有効期限切れの結果をすぐに返し、バックグラウンドで取り直す。
+            # cursorの2ページ目以降はPITのスナップショットなので取り直しても結果は変わらない。
+            if not use_cursor:
+                search_flight.start(cache_key, run_search)
+            return json_response(with_exact_total(stale, count_key))
+        # 同じ検索が実行中であれば、Elasticsearchに問い合わせずにその結果を待つ
+        result = await search_flight.do(cache_key, run_search)
+    return json_response(with_exact_total(result, count_key))
+
+class MultiSearchItem(BaseModel):
+    """
+    /msearch の1件分の検索パラメータ。/search のクエリパラメータと同じ意味を持つ。
+    sizeに0を指定すると件数だけを取得できる（メッセージ種別ごとの件数など）。
+    """
+    q: str = ""
+    from_: int = 0
+    exact: bool = False
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    author_name: Optional[str] = None
+    video_id: Optional[str] = None
+    message_type: str = "all"
+    sort_order: str = "desc"
+    fields: Optional[str] = None
+    size: int = SEARCH_PAGE_SIZE
+
+class MultiSearchRequest(BaseModel):
+    searches: List[MultiSearchItem]
+
+# msearchのレスポンスのうち、APIが使用する部分。
+# statusは常に含まれるため、ヒットのない要素が配列から消えて順序がずれることはない。
+MSEARCH_FILTER_PATH = [
+    "took",
+    "responses.status",
+    "responses.timed_out",
+    "responses.terminated_early",
+    "responses.error.type",
+    "responses.error.reason",
+    "responses.hits.total",
+    "responses.hits.hits._id",
+    "responses.hits.hits._source",
+]
+
+@app.post("/msearch")
+async def multi_search_chat_logs(request: MultiSearchRequest):
+    """
+    複数の検索をまとめて実行するエンドポイント。
+    各検索は /search と同じ方法でクエリを構築し、Elasticsearchの_msearchで1回のリクエストとして実行する。
+    結果はリクエストと同じ順序で {"responses": [{"total", "totalExact", "partial", "results"} | {"error"}]} の形式で返す。
+    ページングはoffsetのみ対応（cursorは /search を使う）。
+    """
+    searches = request.searches
+    if not searches:
+        return {"responses": []}
+    if len(searches) > MSEARCH_MAX_SEARCHES:
+        raise HTTPException(status_code=400, detail=f"一度に実行できる検索は{MSEARCH_MAX_SEARCHES}件までです。")
+    for item in searches:
+        if item.sort_order not in ("asc", "desc"):
+            raise HTTPException(status_code=400, detail="sort_orderにはascまたはdescを指定してください。")
+        if item.from_ < 0 or not 0 <= item.size <= SEARCH_PAGE_SIZE:
+            raise HTTPException(status_code=400, detail=f"from_は0以上、sizeは0から{SEARCH_PAGE_SIZE}の範囲で指定してください。")
+        item.q = normalize_search_q(item.q, item.exact)
+    result_fields = [parse_result_fields(item.fields) for item in searches]
+
+    es = get_es()
+    await chat_logs_generation.check(es)
+
+    responses: List[Optional[Dict[str, Any]]] = [None] * len(searches)
+    cache_keys: List[Optional[str]] = [None] * len(searches)
+    count_keys = [
+        count_cache_key(item.q, item.exact, item.date_from, item.date_to, item.author_name, item.video_id, item.message_type)
+        for item in searches
+    ]
+    pending = []
+    for i, item in enumerate(searches):
+        # 既定の件数の検索は /search と同じキーでキャッシュを共有する
+        if SEARCH_CACHE_SIZE > 0 and item.size == SEARCH_PAGE_SIZE:
+            cache_keys[i] = search_cache_key(
+                item.q, item.exact, item.date_from, item.date_to, item.author_name, item.video_id,
+                item.message_type, item.sort_order, item.from_, None, result_fields[i]
+            )
+            cached = search_result_cache.get(cache_keys[i])
+            if cached is not None:
+                responses[i] = with_exact_total(cached, count_keys[i])
+                continue
+        pending.append(i)
+
+    if not pending:
+        return json_response({"responses": responses})
+
+    try:
+        # 投稿者名の解決は検索ごとに独立しているため並行して実行する
+        queries = await asyncio.gather(*[
+            build_search_query(
+                es,
+                q=searches[i].q,
+                exact=searches[i].exact,
+                date_from=searches[i].date_from,
+                date_to=searches[i].date_to,
+                author_name=searches[i].author_name,
+                video_id=searches[i].video_id,
+                message_type=searches[i].message_type,
+            )
+            for i in pending
+        ])
+
+        body = []
+        for i, query in zip(pending, queries):
+            item = searches[i]
+            source_includes = source_includes_for(result_fields[i])
+            search = {
+                "query": query,
+                "sort": [{"timestamp": {"order": item.sort_order}}],
+                "from": item.from_,
+                "size": item.size,
+                "_source": source_includes if source_includes and item.size > 0 else False,
+                "track_total_hits": SEARCH_TOTAL_HITS,
+                **search_budget_kwargs(search_query_class(item.q, item.exact)),
+            }
+            body.append(chat_logs_target(item.date_from, item.date_to, item.video_id))
+            body.append(search)
+
+        started = time.perf_counter()
+        response = await es.msearch(searches=body, filter_path=MSEARCH_FILTER_PATH)
+        observe_es_response("/msearch", started, response)
+    except Exception as e:
+        print(f"複数検索中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=500, detail="検索処理中にエラーが発生しました。")
+
+    for i, item_response in zip(pending, response.get("responses", [])):
+        if "error" in item_response:
+            # 1件の失敗で他の検索結果を捨てないよう、要素ごとにエラーを返す
+            print(f"複数検索の{i + 1}件目でエラーが発生しました: {item_response['error']}")
+            responses[i] = {"error": "検索処理中にエラーが発生しました。"}
+            continue
+        hits_section = item_response.get("hits", {})
+        partial = is_partial_response(item_response)
+        if partial:
+            partial_searches_total.inc("/msearch", search_query_class(searches[i].q, searches[i].exact))
+        result = {
+            **read_total_hits(hits_section, count_keys[i], partial),
+            "partial": partial,
+            "results": [format_search_hit(hit, result_fields[i]) for hit in hits_section.get("hits", [])],
+        }
+        if cache_keys[i] and not partial:
+            search_result_cache.set(cache_keys[i], result)
+        responses[i] = with_exact_total(result, count_keys[i])
+
+    return json_response({"responses": responses})
+
+@app.get("/count")
+async def count_chat_logs(
+    q: str = "",
+    exact: bool = False,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    author_name: Optional[str] = None,
+    video_id: Optional[str] = None,
+    message_type: str = "all",
+):
+    """
+    /search と同じ検索条件に一致するメッセージの正確な件数を返すエンドポイント。
+    /search の totalExact が false の場合に、フロントエンドが1ページ目の表示後に呼び出す。
+    結果はキャッシュされ、以降の /search の total にも反映される。
+    """
+    es = get_es()
+    await chat_logs_generation.check(es)
+    q = normalize_search_q(q, exact)
+    count_key = count_cache_key(q, exact, date_from, date_to, author_name, video_id, message_type)
+    cached = count_cache.get(count_key)
+    if cached is not None:
+        return {"total": cached, "totalExact": True}
+
+    try:
+        query = await build_search_query(
+            es,
+            q=q,
+            exact=exact,
+            date_from=date_from,
+            date_to=date_to,
+            author_name=author_name,
+            video_id=video_id,
+            message_type=message_type,
+        )
+        started = time.perf_counter()
+        response = await es.count(query=query, **chat_logs_target(date_from, date_to, video_id))
+        observe_es_response("/count", started, response)
+    except Exception as e:
+        print(f"件数の取得中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=500, detail="件数の取得中にエラーが発生しました。")
+
+    total = response["count"]
+    count_cache.set(count_key, total)
+    return {"total": total, "totalExact": True}
+
+async def fetch_context_side(
+    es,
+    video_id: str,
+    timestamp_range: Dict[str, Any],
+    order: str,
+    size: int,
+    exclude_id: Optional[str],
+    source_kwargs: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """
+    同じ動画内で、指定したtimestamp範囲のメッセージを時刻順にsize件取得する。
+    """
+    if size <= 0:
+        return []
+    query = {
+        "bool": {
+            "filter": [
+                {"term": {"videoId.keyword": video_id}},
+                {"range": {"timestamp": timestamp_range}},
+            ]
+        }
     }
+    if exclude_id:
+        query["bool"]["must_not"] = [{"ids": {"values": [exclude_id]}}]
+    response = await es.search(
+        query=query,
+        sort=[{"timestamp": {"order": order}}],
+        size=size,
+        track_total_hits=False,
+        filter_path=["hits.hits._id", "hits.hits._source"],
+        **source_kwargs,
+        **chat_logs_target(video_id=video_id)
+    )
+    return response.get("hits", {}).get("hits", [])
 
+@app.get("/context")
+async def get_chat_context(
+    id: Optional[str] = None,
+    video_id: Optional[str] = None,
+    timestamp: Optional[int] = None,
+    before: int = 20,
+    after: int = 20,
+    fields: Optional[str] = None,
+):
+    """
+    検索結果のメッセージの前後の会話を返すエンドポイント。
+    メッセージID（id）、または動画ID（video_id）とtimestamp（ミリ秒）で基準位置を指定し、
+    同じ動画内の直前 before 件と直後 after 件を時刻順に返す。
+    """
+    if not id and not (video_id and timestamp is not None):
+        raise HTTPException(status_code=400, detail="id、または video_id と timestamp を指定してください。")
+    before = max(0, min(before, CONTEXT_MAX_SIZE))
+    after = max(0, min(after, CONTEXT_MAX_SIZE))
+    result_fields = parse_result_fields(fields)
+    source_includes = source_includes_for(result_fields)
+    for required in ("videoId", "timestamp"):
+        if required not in source_includes:
+            source_includes.append(required)
+    source_kwargs = {"source_includes": source_includes}
+
+    es = get_es()
     try:
-        response = es.search(
-            index=CHAT_LOGS_INDEX_NAME,
-            from_=search_query["from"],
-            query=search_query["query"],
-            sort=search_query["sort"],
-            size=search_query["size"],
-            track_total_hits=SEARCH_TOTAL_HITS
+        anchor = None
+        if id:
+            # video_idも指定されていれば、その動画のシャードだけを探す
+            response = await es.search(
+                query={"ids": {"values": [id]}},
+                size=1,
+                track_total_hits=False,
+                filter_path=["hits.hits._id", "hits.hits._source"],
+                **source_kwargs,
+                **chat_logs_target(video_id=video_id)
+            )
+            hits = response.get("hits", {}).get("hits", [])
+            if not hits:
+                raise HTTPException(status_code=404, detail="指定されたメッセージが見つかりません。")
+            anchor = hits[0]
+            video_id = anchor["_source"].get("videoId")
+            timestamp = anchor["_source"].get("timestamp")
+            if not video_id or timestamp is None:
+                return {"anchor": format_search_hit(anchor, result_fields), "before": [], "after": []}
+
+        # 同じtimestampのメッセージは「後」に含める
+        before_hits, after_hits = await asyncio.gather(
+            fetch_context_side(es, video_id, {"lt": timestamp}, "desc", before, None, source_kwargs),
+            fetch_context_side(es, video_id, {"gte": timestamp}, "asc", after, id, source_kwargs),
         )
-        
-        # 総ヒット件数を取得
-        total_hits = response["hits"]["total"]["value"]
-        
-        # フロントエンド向けの形式にレスポンスを整形
-        results = []
-        for hit in response["hits"]["hits"]:
-            source = hit["_source"]
-            thumbnail_url = calculate_thumbnail_url(source.get("videoId"), source.get("elapsedTime"))
-            author_icon_url = calculate_author_icon_url(source.get("authorChannelId"))
-            result = {
-                "id": hit["_id"],
-                "videoId": source.get("videoId"),
-                "videoTitle": source.get("videoTitle"),
-                "datetime": source.get("datetime"),
-                "elapsedTime": source.get("elapsedTime"),
-                "timestampSec": source.get("timestamp"),
-                "message": source.get("message"),
-                "type": source.get("type"),
-                "author": source.get("authorName"),
-                "authorChannelId": source.get("authorChannelId"),
-                "authorIconUrl": author_icon_url,
-                "thumbnailUrl": thumbnail_url,
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"前後のメッセージの取得中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=500, detail="前後のメッセージの取得中にエラーが発生しました。")
+
+    return {
+        "anchor": format_search_hit(anchor, result_fields) if anchor else None,
+        "before": [format_search_hit(hit, result_fields) for hit in reversed(before_hits)],
+        "after": [format_search_hit(hit, result_fields) for hit in after_hits],
+    }
+
+async def iter_export_lines(
+    batches,
+    export_format: str,
+    fields: List[str],
+):
+    """
+    検索結果のバッチをNDJSONまたはCSVの文字列に変換しながら順に返す。
+    """
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # Excelで開いた際に文字化けしないようBOMを付ける
+        buffer.write("\ufeff")
+        writer.writerow(fields)
+        async for hits in batches:
+            for hit in hits:
+                result = format_search_hit(hit, fields)
+                writer.writerow(["" if result[field] is None else result[field] for field in fields])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        async for hits in batches:
+            yield "".join(
+                json.dumps(format_search_hit(hit, fields), ensure_ascii=False) + "\n" for hit in hits
+            )
+
+@app.get("/export")
+async def export_chat_logs(
+    q: str = "",
+    exact: bool = False,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    author_name: Optional[str] = None,
+    video_id: Optional[str] = None,
+    message_type: str = "all",
+    sort_order: str = "desc",
+    format: str = "ndjson",
+    fields: Optional[str] = None,
+):
+    """
+    検索条件に一致するチャットログを全件、NDJSONまたはCSVでストリーミング出力するエンドポイント。
+    検索条件は /search と同じ。PIT + search_afterでEXPORT_BATCH_SIZE件ずつ読み出すため、
+    ヒット件数に関わらずメモリ使用量は一定。
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="formatには ndjson または csv を指定してください。")
+    if sort_order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="sort_orderにはascまたはdescを指定してください。")
+    q = normalize_search_q(q, exact)
+    result_fields = parse_result_fields(fields) or list(SEARCH_RESULT_FIELDS)
+    source_includes = source_includes_for(result_fields)
+    source_kwargs = {"source_includes": source_includes} if source_includes else {"source": False}
+
+    es = get_es()
+    await chat_logs_generation.check(es)
+
+    # ストリーミング開始後はステータスコードを変更できないため、PITの作成と最初のバッチの取得までは先に済ませておく
+    try:
+        query, pit = await asyncio.gather(
+            build_search_query(
+                es,
+                q=q,
+                exact=exact,
+                date_from=date_from,
+                date_to=date_to,
+                author_name=author_name,
+                video_id=video_id,
+                message_type=message_type,
+            ),
+            es.open_point_in_time(keep_alive=PIT_KEEP_ALIVE, **chat_logs_target(date_from, date_to, video_id)),
+        )
+    except Exception as e:
+        print(f"エクスポートの準備中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=500, detail="エクスポート処理中にエラーが発生しました。")
+
+    batches = iter_pit_batches(
+        es,
+        pit["id"],
+        query=query,
+        sort=[
+            {"timestamp": {"order": sort_order}},
+            {"_shard_doc": {"order": sort_order}},
+        ],
+        batch_size=EXPORT_BATCH_SIZE,
+        keep_alive=PIT_KEEP_ALIVE,
+        **source_kwargs
+    )
+    try:
+        first_batch = await batches.__anext__()
+    except StopAsyncIteration:
+        first_batch = None
+    except Exception as e:
+        # 例外でジェネレーターが終了する際にPITは解放される
+        print(f"エクスポートの最初のバッチの取得中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=500, detail="エクスポート処理中にエラーが発生しました。")
+
+    async def prefetched_batches():
+        if first_batch is None:
+            return
+        yield first_batch
+        async for hits in batches:
+            yield hits
+
+    if format == "csv":
+        media_type = "text/csv; charset=utf-8"
+    else:
+        media_type = "application/x-ndjson"
+    filename = f"utsulog_export_{datetime.now().strftime('%Y%m%d%H%M%S')}.{format}"
+    return StreamingResponse(
+        iter_export_lines(prefetched_batches(), format, result_fields),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/authors/suggest")
+async def suggest_authors(prefix: str = "", limit: int = 10):
+    """
+    投稿者名の入力補完エンドポイント。prefixで始まる投稿者名（大文字/小文字・全角/半角を区別しない）を返す。
+    プロセス内のソート済み配列から引くため、入力のたびにElasticsearchへ問い合わせることはない。
+    """
+    if not prefix.strip():
+        return {"authors": []}
+    limit = max(1, min(limit, AUTHOR_SUGGEST_MAX_LIMIT))
+
+    es = get_es()
+    await chat_logs_generation.check(es)
+    try:
+        await author_index.ensure_loaded(es)
+    except Exception as e:
+        print(f"投稿者インデックスの読み込み中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=503, detail="投稿者名の候補を取得できません。")
+
+    return {
+        "authors": [
+            {
+                "name": entry["name"],
+                "channelIds": entry["channelIds"],
+                "count": entry["count"],
+                "authorIconUrl": calculate_author_icon_url(entry["channelIds"][0]) if entry["channelIds"] else "",
             }
-            results.append(result)
-            
-        return {"total": total_hits, "results": results}
+            for entry in author_index.suggest(prefix.strip(), limit)
+        ]
+    }
 
+@app.get("/authors/{channel_id}")
+async def get_author(channel_id: str):
+    """
+    投稿者インデックスから、投稿者の名前の一覧・最初/最後の投稿時刻・メッセージ数を返す。
+    """
+    if not AUTHORS_INDEX_NAME:
+        raise HTTPException(status_code=404, detail="投稿者インデックスが設定されていません。")
+    es = get_es()
+    try:
+        response = await es.get(index=AUTHORS_INDEX_NAME, id=channel_id)
     except Exception as e:
-        print(f"検索中にエラーが発生しました: {e}")
-        raise HTTPException(status_code=500, detail="検索処理中にエラーが発生しました。")
+        if is_not_found(e):
+            raise HTTPException(status_code=404, detail="投稿者が見つかりません。")
+        print(f"投稿者情報の取得中にエラーが発生しました: {e}")
+        raise HTTPException(status_code=500, detail="投稿者情報の取得中にエラーが発生しました。")
+    source = response["_source"]
+    return {
+        "authorChannelId": channel_id,
+        "names": source.get("names", []),
+        "latestName": source.get("latestName"),
+        "firstSeen": source.get("firstSeen"),
+        "lastSeen": source.get("lastSeen"),
+        "messageCount": source.get("messageCount", 0),
+        "authorIconUrl": calculate_author_icon_url(channel_id),
+    }
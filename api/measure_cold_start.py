@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Lambdaのコールドスタート時間を計測するスクリプト。
+
+新しいPythonプロセスで `python -X importtime -c "import main"` を繰り返し実行し、
+mainが直接インポートするモジュールごとのインポート時間（中央値）と、main.handler に
+Function URL形式のイベントを1回渡した際の初回呼び出し時間を表示する。
+GET / はElasticsearchを使わないため、/search などが初回に払う main.get_es() の時間も別に計測し、
+最初のElasticsearchへのリクエストまでの合計を表示する。
+
+--baseline にgitのリビジョンを指定すると、そのリビジョンの api/main.py でも同じ計測を行い、合計を比較する。
+（クライアントをインポート時に生成し get_es() がない版では、get_es() の時間は0になる）
+
+使い方:
+    cd api
+    python measure_cold_start.py            # 5回計測
+    python measure_cold_start.py -n 10 --top 15
+    python measure_cold_start.py --no-invoke # インポート時間のみ
+    python measure_cold_start.py --baseline HEAD~10 # 過去のmain.pyと比較
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# main.pyのインポートに必要な環境変数（未設定の場合のみダミー値を使う）
+DEFAULT_ENV = {
+    "CORS_ORIGINS": "http://localhost:3000",
+    "ELASTICSEARCH_HOST": "http://127.0.0.1:9",
+    "VIDEOS_INDEX_NAME": "videos",
+    "CHAT_LOGS_INDEX_NAME": "youtube-chat-logs",
+    "THUMBNAIL_BASE_URL": "http://localhost/thumbnails",
+    "AUTHOR_ICON_BASE_URL": "http://localhost/author-icons",
+}
+
+# main.handler に渡すLambda Function URL（ペイロード形式2.0）のイベント
+INVOKE_SCRIPT = """
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+event = {
+    "version": "2.0",
+    "routeKey": "$default",
+    "rawPath": "/",
+    "rawQueryString": "",
+    "headers": {"host": "localhost", "x-forwarded-proto": "https", "x-forwarded-port": "443"},
+    "requestContext": {
+        "http": {"method": "GET", "path": "/", "protocol": "HTTP/1.1", "sourceIp": "127.0.0.1"},
+        "stage": "$default",
+    },
+    "isBase64Encoded": False,
+}
+class Context:
+    function_name = "measure_cold_start"
+response = main.handler(event, Context())
+invoked = time.perf_counter()
+assert response["statusCode"] == 200, response
+getattr(main, "get_es", lambda: None)()
+es_ready = time.perf_counter()
+print(f"{(imported - start) * 1000:.1f} {(invoked - imported) * 1000:.1f} {(es_ready - invoked) * 1000:.1f}")
+"""
+
+
+def run_importtime(env):
+    """
+    新しいプロセスでmainをインポートし、mainが直接インポートするモジュールごとの累積インポート時間(ms)を返す。
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_part, cumulative_part, name = line.split("|")
+        # ネストの深さはインデント（2スペースずつ）で表される。
+        # main自身と、mainから直接インポートされたモジュールをパッケージ単位で集計する。
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        module = name.strip()
+        if depth == 0 and module == "main":
+            self_us = int(self_part.split(":")[1])
+            modules["main (self)"] = modules.get("main (self)", 0.0) + self_us / 1000
+        elif depth == 1:
+            top_level = module.split(".")[0]
+            modules[top_level] = modules.get(top_level, 0.0) + int(cumulative_part) / 1000
+    return modules
+
+
+def run_invoke(env, cwd=API_DIR):
+    """
+    新しいプロセスでmainのインポート、main.handlerの初回呼び出し、main.get_es()の初回呼び出しにかかった時間(ms)を返す。
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", INVOKE_SCRIPT],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    import_ms, invoke_ms, es_ms = result.stdout.strip().splitlines()[-1].split()
+    return float(import_ms), float(invoke_ms), float(es_ms)
+
+
+def measure_invoke(env, runs, cwd=API_DIR):
+    """
+    run_invokeをruns回実行し、各時間と合計（最初のElasticsearchへのリクエストまで）の中央値(ms)を返す。
+    """
+    samples = [run_invoke(env, cwd) for _ in range(runs)]
+    imports, invokes, clients = zip(*samples)
+    return (
+        statistics.median(imports),
+        statistics.median(invokes),
+        statistics.median(clients),
+        statistics.median(sum(sample) for sample in samples),
+    )
+
+
+def checkout_main(revision, directory):
+    """
+    指定したリビジョンの api/main.py をdirectoryに書き出す。
+    """
+    source = subprocess.run(
+        ["git", "show", f"{revision}:api/main.py"],
+        cwd=API_DIR, capture_output=True, check=True,
+    ).stdout
+    with open(os.path.join(directory, "main.py"), "wb") as f:
+        f.write(source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="main.handler のコールドスタート時間を計測する")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="計測回数")
+    parser.add_argument("--top", type=int, default=10, help="表示するモジュール数")
+    parser.add_argument("--no-invoke", action="store_true", help="handlerの初回呼び出しを計測しない")
+    parser.add_argument("--baseline", metavar="REV", help="比較するgitのリビジョン（そのリビジョンのapi/main.pyでも計測する）")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    for key, value in DEFAULT_ENV.items():
+        env.setdefault(key, value)
+
+    samples = {}
+    for _ in range(args.runs):
+        for module, ms in run_importtime(env).items():
+            samples.setdefault(module, []).append(ms)
+
+    medians = {module: statistics.median(values) for module, values in samples.items()}
+    total = sum(medians.values())
+    print(f"Import time of modules imported by main (median of {args.runs} runs):")
+    for module, ms in sorted(medians.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {module:<24} {ms:8.1f} ms")
+    print(f"  {'(total)':<24} {total:8.1f} ms")
+
+    if not args.no_invoke:
+        columns = [("current", measure_invoke(env, args.runs))]
+        if args.baseline:
+            with tempfile.TemporaryDirectory() as directory:
+                checkout_main(args.baseline, directory)
+                columns.insert(0, (args.baseline, measure_invoke(env, args.runs, directory)))
+        print(f"\nmain.handler cold start (median of {args.runs} runs):")
+        print(f"  {'':<48}" + "".join(f" {name:>12}" for name, _ in columns))
+        labels = [
+            "import main",
+            "first invocation (GET /)",
+            "first get_es()",
+            "(total before the first Elasticsearch request)",
+        ]
+        for i, label in enumerate(labels):
+            print(f"  {label:<48}" + "".join(f" {values[i]:9.1f} ms" for _, values in columns))
+        if args.baseline:
+            difference = columns[1][1][3] - columns[0][1][3]
+            print(f"  {'(difference of the total)':<48} {'':>12} {difference:+9.1f} ms")
+
+if __name__ == "__main__":
+    main()
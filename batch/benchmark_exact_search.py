@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+完全一致検索（match_phrase）のレイテンシとヒット件数を、message（kuromoji）と
+message.bigram（2文字ずつの部分文字列検索）で比較するスクリプト。
+
+チャットログと同じインデックステンプレート（build_index_template）で一時インデックスを作成し、
+実際のチャットに近い形のメッセージを投入してから、同じ検索語を両方のフィールドに対して実行する。
+ヒット件数の差は、kuromojiの分かち書きと境界が合わずに message では見つからない部分文字列を表す。
+計測後、一時インデックスは削除する。
+
+使い方:
+    cd batch
+    ELASTICSEARCH_URL=http://localhost:9200 python benchmark_exact_search.py
+    ELASTICSEARCH_URL=http://localhost:9200 python benchmark_exact_search.py --docs 500000 -n 50
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+
+# import_chatlogs.pyのインポートに必要な環境変数（未設定の場合のみダミー値を使う）
+os.environ.setdefault("LOCAL_CHAT_LOGS_DIR", "/tmp")
+
+import requests
+import import_chatlogs
+
+BENCHMARK_INDEX_NAME = "utsulog-benchmark-exact-search"
+BULK_BATCH_SIZE = 5000
+
+GREETINGS = ["こんばんは", "こんばんは〜", "おはうつろ", "初見です", "お疲れさまでした", "おつうつろ", "ただいま"]
+REACTIONS = ["草", "www", "wwwww", "888888", "かわいい", "かわいすぎる", "えっ", "すごい", "天才", "神回"]
+PHRASES = [
+    "今日も配信ありがとう",
+    "歌声ほんとに好き",
+    "ここ何回聞いても泣ける",
+    "切り抜きから来ました",
+    "次の配信も楽しみにしてます",
+    "リクエストにこたえてくれてありがとう",
+    "今のってもしかして新曲？",
+    "ＢＧＭ好き",
+    "ｱｰｶｲﾌﾞで見てます",
+    "まってましたー！",
+]
+EMOJIS = [":heart:", ":_うつろハート:", ":_草:", ":sparkles:", ":clap:"]
+
+# 検索語（部分文字列や、kuromojiの分かち書きと境界がずれるものを含む）
+QUERIES = [
+    "配信ありがとう",
+    "ありがと",
+    "がとう",
+    "歌声",
+    "声ほんと",
+    "泣ける",
+    "切り抜き",
+    "り抜き",
+    "新曲",
+    "楽しみ",
+    "しみにして",
+    "ww",
+    "8888",
+    "bgm",
+    "アーカイブ",
+    "うつろハート",
+]
+
+
+def generate_messages(count, seed=0):
+    """
+    挨拶・リアクション・定型文・絵文字を組み合わせて、チャットに近い形のメッセージを生成する。
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = []
+        if rng.random() < 0.3:
+            parts.append(rng.choice(GREETINGS))
+        if rng.random() < 0.6:
+            parts.append(rng.choice(PHRASES))
+        if rng.random() < 0.5 or not parts:
+            parts.append(rng.choice(REACTIONS))
+        if rng.random() < 0.3:
+            parts.append(rng.choice(EMOJIS))
+        yield rng.choice(["", " ", "！"]).join(parts)
+
+
+def es_request(method, path, **kwargs):
+    headers = import_chatlogs._get_auth_headers()
+    headers["Content-Type"] = kwargs.pop("content_type", "application/json")
+    response = requests.request(
+        method,
+        f"{import_chatlogs.ELASTICSEARCH_URL}{path}",
+        headers=headers,
+        timeout=600,
+        verify=import_chatlogs.ELASTICSEARCH_CA,
+        **kwargs
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def create_benchmark_index(doc_count):
+    """
+    チャットログのテンプレートと同じ設定・マッピングで一時インデックスを作成し、メッセージを投入する。
+    """
+    try:
+        es_request("DELETE", f"/{BENCHMARK_INDEX_NAME}")  # 前回 --keep で残したインデックス
+    except requests.exceptions.RequestException:
+        pass
+    template = import_chatlogs.build_index_template(BENCHMARK_INDEX_NAME)["template"]
+    es_request("PUT", f"/{BENCHMARK_INDEX_NAME}", json=template)
+
+    lines = []
+    for i, message in enumerate(generate_messages(doc_count)):
+        lines.append(json.dumps({"index": {"_index": BENCHMARK_INDEX_NAME}}))
+        lines.append(json.dumps({
+            "id": f"bench-{i}",
+            "videoId": f"video{i % 200:04d}",
+            "type": "chat",
+            "message": message,
+            "timestamp": 1714566896000 + i * 1000,
+        }, ensure_ascii=False))
+        if len(lines) >= BULK_BATCH_SIZE * 2:
+            es_request("POST", "/_bulk", data=("\n".join(lines) + "\n").encode("utf-8"), content_type="application/x-ndjson")
+            lines = []
+    if lines:
+        es_request("POST", "/_bulk", data=("\n".join(lines) + "\n").encode("utf-8"), content_type="application/x-ndjson")
+    es_request("POST", f"/{BENCHMARK_INDEX_NAME}/_refresh")
+    es_request("POST", f"/{BENCHMARK_INDEX_NAME}/_forcemerge?max_num_segments=1")
+
+
+def run_query(field, q):
+    """
+    /search の完全一致検索と同じ形（timestamp降順、100件、正確な件数）でクエリを実行し、
+    (ESのtook(ms), ヒット件数) を返す。
+    """
+    body = {
+        "query": {"bool": {"must": [{"match_phrase": {field: q}}]}},
+        "sort": [{"timestamp": "desc"}],
+        "size": 100,
+        "track_total_hits": True,
+        "_source": False,
+    }
+    result = es_request("POST", f"/{BENCHMARK_INDEX_NAME}/_search?request_cache=false", json=body)
+    return result["took"], result["hits"]["total"]["value"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="完全一致検索のレイテンシを message と message.bigram で比較する")
+    parser.add_argument("--docs", type=int, default=200000, help="投入するメッセージ数")
+    parser.add_argument("-n", "--runs", type=int, default=20, help="1つの検索語あたりの実行回数")
+    parser.add_argument("--keep", action="store_true", help="計測後に一時インデックスを削除しない")
+    args = parser.parse_args()
+
+    try:
+        print(f"Indexing {args.docs} messages into '{BENCHMARK_INDEX_NAME}'...")
+        create_benchmark_index(args.docs)
+
+        print(f"\nmatch_phrase latency (median / p95 of {args.runs} runs, ms as reported by took) and hits:")
+        print(f"  {'query':<16} {'message':>22} {'message.bigram':>22}")
+        totals = {"message": [], "message.bigram": []}
+        for q in QUERIES:
+            columns = []
+            for field in ("message", "message.bigram"):
+                run_query(field, q)  # ウォームアップ
+                samples = [run_query(field, q) for _ in range(args.runs)]
+                tooks = sorted(took for took, _ in samples)
+                totals[field].extend(tooks)
+                p95 = tooks[min(len(tooks) - 1, int(len(tooks) * 0.95))]
+                columns.append(f"{statistics.median(tooks):5.1f}/{p95:5.1f} {samples[0][1]:9d}")
+            print(f"  {q:<16} {columns[0]:>22} {columns[1]:>22}")
+        print(
+            f"  {'(all queries)':<16} {statistics.median(totals['message']):5.1f} median"
+            f"{'':>10} {statistics.median(totals['message.bigram']):5.1f} median"
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Benchmark failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if not args.keep:
+            try:
+                es_request("DELETE", f"/{BENCHMARK_INDEX_NAME}")
+            except requests.exceptions.RequestException:
+                pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import os
+import requests
+import json
+import base64
+import time
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# --- 設定 ---
+ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL")
+CHAT_LOGS_INDEX_NAME = os.getenv("CHAT_LOGS_INDEX_NAME", "youtube-chat-logs")
+VIDEOS_INDEX_NAME = os.getenv("VIDEOS_INDEX_NAME")
+TIMELINE_INDEX_NAME = os.getenv("TIMELINE_INDEX_NAME", "youtube-chat-timeline")
+ELASTICSEARCH_CA = os.getenv('ELASTICSEARCH_CA') # 証明書ファイル名
+ELASTICSEARCH_ADMIN = os.getenv('ELASTICSEARCH_ADMIN')
+ELASTICSEARCH_PASSWORD = os.getenv('ELASTICSEARCH_PASSWORD')
+# APIのキャッシュ破棄に使う世代マーカーを保存するインデックス
+META_INDEX_NAME = os.getenv("META_INDEX_NAME", "utsulog-meta")
+# 集計の最小単位（秒）。APIはこの倍数の幅に再集計して返す。
+BUCKET_SECONDS = int(os.getenv("TIMELINE_BUCKET_SECONDS", "60"))
+# "videoId"を指定すると、動画ごとの集計をその動画のシャードだけに送る（import_chatlogs.pyと同じ値を指定する）
+ROUTING = os.getenv("CHAT_LOGS_ROUTING", "none")
+# 1を指定すると、件数に変化のない動画も含めて全て再集計する
+REBUILD_ALL = os.getenv("TIMELINE_REBUILD_ALL") == "1"
+
+# ELASTICSEARCH_URLが設定されていない場合はエラー
+if not ELASTICSEARCH_URL:
+    raise ValueError("ELASTICSEARCH_URL environment variable is not set.")
+
+MAX_WORKERS = 4  # 並列処理するスレッド数
+MAX_VIDEOS = 10000 # 1回の集計で扱う動画数の上限
+JST = timezone(timedelta(hours=9))
+# --- 設定ここまで ---
+
+def _get_auth_headers(content_type="application/json"):
+    headers = {"Content-Type": content_type}
+    if ELASTICSEARCH_ADMIN and ELASTICSEARCH_PASSWORD:
+        auth_str = f"{ELASTICSEARCH_ADMIN}:{ELASTICSEARCH_PASSWORD}"
+        encoded_auth = base64.b64encode(auth_str.encode()).decode()
+        headers["Authorization"] = f"Basic {encoded_auth}"
+    return headers
+
+def _search(index_name, body, params=None):
+    response = requests.post(
+        f"{ELASTICSEARCH_URL}/{index_name}/_search",
+        headers=_get_auth_headers(),
+        params=params,
+        json=body,
+        timeout=60,
+        verify=ELASTICSEARCH_CA
+    )
+    response.raise_for_status()
+    return response.json()
+
+def create_index_if_not_exists(index_name, es_url):
+    """
+    ロールアップ用のインデックスが存在しない場合、作成する。
+    バケットの配列は検索に使わないため、インデックス化せず_sourceにのみ保存する。
+    """
+    index_url = f"{es_url}/{index_name}"
+    headers = _get_auth_headers()
+    try:
+        response = requests.head(index_url, headers=headers, verify=ELASTICSEARCH_CA)
+        if response.status_code == 404:
+            print(f"Index '{index_name}' does not exist. Creating...")
+            settings = {
+                "mappings": {
+                    "properties": {
+                        "videoId": {"type": "keyword"},
+                        "bucketSeconds": {"type": "integer"},
+                        "startTimestamp": {"type": "long"},
+                        "total": {"type": "long"},
+                        "computedAt": {"type": "date"},
+                        "buckets": {"type": "object", "enabled": False}
+                    }
+                }
+            }
+            create_response = requests.put(index_url, headers=headers, json=settings, verify=ELASTICSEARCH_CA)
+            create_response.raise_for_status()
+            print(f"Index '{index_name}' created successfully.")
+        elif response.status_code == 200:
+            print(f"Index '{index_name}' already exists.")
+        else:
+            print(f"Unexpected status code when checking index '{index_name}': {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Error checking/creating index '{index_name}': {e}")
+
+def bump_index_generation(index_name, es_url):
+    """
+    集計完了をAPIに知らせるため、メタインデックスの世代マーカーを更新する。
+    APIはこの値の変化を検知して、タイムラインのキャッシュを破棄する。
+    """
+    doc_url = f"{es_url}/{META_INDEX_NAME}/_doc/{index_name}"
+    doc = {
+        "generation": int(time.time() * 1000),
+        "updatedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        response = requests.put(doc_url, headers=_get_auth_headers(), json=doc, verify=ELASTICSEARCH_CA)
+        response.raise_for_status()
+        print(f"Index generation for '{index_name}' bumped to {doc['generation']}.")
+    except requests.exceptions.RequestException as e:
+        print(f"Error bumping index generation for '{index_name}': {e}")
+
+def get_video_start_timestamps():
+    """
+    videosインデックスから videoId -> 配信開始時刻（ミリ秒）の対応を取得する。
+    actualStartTimeは YYYYMMDDHHMMSS 形式のJST。
+    """
+    if not VIDEOS_INDEX_NAME:
+        return {}
+    result = _search(VIDEOS_INDEX_NAME, {
+        "size": MAX_VIDEOS,
+        "_source": ["video_url", "actualStartTime"],
+        "query": {"match_all": {}}
+    })
+    start_timestamps = {}
+    for hit in result["hits"]["hits"]:
+        source = hit["_source"]
+        video_id = (source.get("video_url") or "").split("v=")[-1].split("&")[0]
+        actual_start_time = source.get("actualStartTime")
+        if not video_id or not actual_start_time:
+            continue
+        try:
+            dt = datetime.strptime(actual_start_time, "%Y%m%d%H%M%S").replace(tzinfo=JST)
+            start_timestamps[video_id] = int(dt.timestamp() * 1000)
+        except ValueError:
+            continue
+    return start_timestamps
+
+def get_chat_counts():
+    """
+    チャットログの動画ごとの件数を取得する。
+    """
+    result = _search(CHAT_LOGS_INDEX_NAME, {
+        "size": 0,
+        "aggs": {
+            "videos": {
+                "terms": {"field": "videoId.keyword", "size": MAX_VIDEOS}
+            }
+        }
+    })
+    return {b["key"]: b["doc_count"] for b in result["aggregations"]["videos"]["buckets"]}
+
+def get_rollup_totals():
+    """
+    既存のロールアップの動画ごとの件数と集計単位を取得する。
+    """
+    try:
+        result = _search(TIMELINE_INDEX_NAME, {
+            "size": MAX_VIDEOS,
+            "_source": ["total", "bucketSeconds"],
+            "query": {"match_all": {}}
+        })
+    except requests.exceptions.RequestException as e:
+        print(f"Could not read existing rollups: {e}")
+        return {}
+    return {
+        hit["_id"]: (hit["_source"].get("total"), hit["_source"].get("bucketSeconds"))
+        for hit in result["hits"]["hits"]
+    }
+
+def compute_rollup(video_id, start_timestamp):
+    """
+    1つの動画について、配信開始からの経過時間BUCKET_SECONDSごとのメッセージ数を集計する。
+    total: 全メッセージ, superchat: 金額付きのメッセージ, transcript: 文字起こし
+    """
+    bucket_ms = BUCKET_SECONDS * 1000
+    histogram = {"field": "timestamp", "interval": bucket_ms}
+    if start_timestamp is not None:
+        # バケットの境界を配信開始時刻に揃える
+        histogram["offset"] = start_timestamp % bucket_ms
+    result = _search(CHAT_LOGS_INDEX_NAME, {
+        "size": 0,
+        "query": {"term": {"videoId.keyword": video_id}},
+        "aggs": {
+            "start": {"min": {"field": "timestamp"}},
+            "timeline": {
+                "histogram": histogram,
+                "aggs": {
+                    "superchat": {"filter": {"exists": {"field": "money.amount"}}},
+                    "transcript": {"filter": {"term": {"type.keyword": "transcript"}}}
+                }
+            }
+        }
+    }, params={"routing": video_id} if ROUTING == "videoId" else None)
+    aggs = result["aggregations"]
+    buckets = aggs["timeline"]["buckets"]
+    if start_timestamp is None:
+        # 配信開始時刻が不明な場合は最初のメッセージを起点とする
+        start_timestamp = int(aggs["start"]["value"] or 0)
+
+    # 検索に使わない配列は列ごとにまとめて保存し、ドキュメントを小さく保つ
+    columns = {"offsets": [], "total": [], "superchat": [], "transcript": []}
+    for bucket in buckets:
+        columns["offsets"].append(int((bucket["key"] - start_timestamp) // 1000))
+        columns["total"].append(bucket["doc_count"])
+        columns["superchat"].append(bucket["superchat"]["doc_count"])
+        columns["transcript"].append(bucket["transcript"]["doc_count"])
+
+    return {
+        "videoId": video_id,
+        "bucketSeconds": BUCKET_SECONDS,
+        "startTimestamp": start_timestamp,
+        "total": sum(columns["total"]),
+        "computedAt": datetime.now(timezone.utc).isoformat(),
+        "buckets": columns,
+    }
+
+def write_rollups(rollups):
+    """
+    集計結果をBulk APIでロールアップ用インデックスに書き込む。ドキュメントIDはvideoId。
+    """
+    lines = []
+    for rollup in rollups:
+        lines.append(json.dumps({"index": {"_index": TIMELINE_INDEX_NAME, "_id": rollup["videoId"]}}))
+        lines.append(json.dumps(rollup, ensure_ascii=False))
+    response = requests.post(
+        f"{ELASTICSEARCH_URL}/_bulk",
+        data=("\n".join(lines) + "\n").encode("utf-8"),
+        headers=_get_auth_headers("application/x-ndjson"),
+        timeout=60,
+        verify=ELASTICSEARCH_CA
+    )
+    response.raise_for_status()
+    resp_json = response.json()
+    if resp_json.get("errors"):
+        failed = [item["index"]["_id"] for item in resp_json.get("items", []) if item["index"].get("error")]
+        print(f"Failed to write rollups for: {', '.join(failed)}")
+        return len(rollups) - len(failed)
+    return len(rollups)
+
+def main():
+    """
+    メイン処理。チャットログの件数が前回の集計から変わった動画のタイムラインを再集計する。
+    """
+    create_index_if_not_exists(TIMELINE_INDEX_NAME, ELASTICSEARCH_URL)
+
+    chat_counts = get_chat_counts()
+    rollup_totals = get_rollup_totals()
+    start_timestamps = get_video_start_timestamps()
+
+    targets = [
+        video_id for video_id, count in chat_counts.items()
+        if REBUILD_ALL or rollup_totals.get(video_id) != (count, BUCKET_SECONDS)
+    ]
+    if not targets:
+        print("All timeline rollups are up to date.")
+        return
+
+    print(f"Building timeline rollups for {len(targets)} videos into '{TIMELINE_INDEX_NAME}'...")
+    rollups = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        future_to_video = {
+            executor.submit(compute_rollup, video_id, start_timestamps.get(video_id)): video_id
+            for video_id in targets
+        }
+        for future in as_completed(future_to_video):
+            video_id = future_to_video[future]
+            try:
+                rollups.append(future.result())
+            except Exception as exc:
+                print(f"An error occurred processing {video_id}: {exc}")
+
+    written = 0
+    for i in range(0, len(rollups), 100):
+        try:
+            written += write_rollups(rollups[i:i + 100])
+        except requests.exceptions.RequestException as e:
+            print(f"Error writing rollups: {e}")
+
+    print(f"\nTimeline rollups finished. {written} videos updated.")
+    if written > 0:
+        bump_index_generation(TIMELINE_INDEX_NAME, ELASTICSEARCH_URL)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
 
 import os
+import sys
+import argparse
 import requests
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 import shutil
 import base64
+import threading
+import time
+import unicodedata
+from datetime import datetime, timezone
 
 # --- 設定 ---
 ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL")
@@ -15,6 +21,27 @@ LOCAL_CHAT_LOGS_ERROR_DIR = os.path.join(os.getenv('LOCAL_CHAT_LOGS_DIR'), "chat
 ELASTICSEARCH_CA = os.getenv('ELASTICSEARCH_CA') # 証明書ファイル名
 ELASTICSEARCH_ADMIN = os.getenv('ELASTICSEARCH_ADMIN')
 ELASTICSEARCH_PASSWORD = os.getenv('ELASTICSEARCH_PASSWORD')
+# APIのキャッシュ破棄に使う世代マーカーを保存するインデックス
+META_INDEX_NAME = os.getenv("META_INDEX_NAME", "utsulog-meta")
+# 期間パーティション。"month"または"quarter"を指定すると、timestamp（UTC）に応じて
+# "<INDEX_NAME>-2024.05" や "<INDEX_NAME>-2024.q2" に書き込み、INDEX_NAMEを読み取り用エイリアスにする。
+# APIのCHAT_LOGS_PARTITIONにも同じ値を指定する。既定の"none"は単一インデックス。
+PARTITION = os.getenv("CHAT_LOGS_PARTITION", "none")
+# 1を指定すると、インポート後に今回書き込みのなかった過去のパーティションをforce mergeする
+FORCEMERGE_OLD_PARTITIONS = os.getenv("CHAT_LOGS_FORCEMERGE") == "1"
+# ルーティング。"videoId"を指定すると、各ドキュメントをvideoIdをキーにルーティングし、
+# 1つの動画のチャットログを同じシャードにまとめる。APIのCHAT_LOGS_ROUTINGにも同じ値を指定する。
+# 既存のデータは --reindex-from で再インデックスする必要がある。
+ROUTING = os.getenv("CHAT_LOGS_ROUTING", "none")
+# インポートの書き込み方法。各メッセージのidフィールドをドキュメントIDに使うため、何度インポートしても重複しない。
+# "create": 登録済みのメッセージは書き込まずにスキップする（既定）。"overwrite": 登録済みのメッセージも上書きする。
+IMPORT_MODE = os.getenv("CHAT_LOGS_IMPORT_MODE", "create")
+# 投稿者インデックス。authorChannelIdごとに、投稿者名・最初/最後の投稿時刻・メッセージ数を保持する。
+# インポートしたファイルごとに差分を反映し、APIの投稿者名の解決とサジェストに使う。空文字列で無効。
+AUTHORS_INDEX_NAME = os.getenv("AUTHORS_INDEX_NAME", "youtube-chat-authors")
+AUTHORS_BATCH_SIZE = 1000 # 投稿者インデックスの更新・再構築で1回に送る件数
+# インデックステンプレートのバージョン。マッピングや設定を変更したら上げる。
+CHAT_LOGS_TEMPLATE_VERSION = 3
 
 # ELASTICSEARCH_URLが設定されていない場合はエラー
 if not ELASTICSEARCH_URL:
@@ -23,7 +50,11 @@ if not ELASTICSEARCH_URL:
 # ELASTICSEARCH_API_KEYが設定されていない場合は、認証なしで接続を試みる
 
 BULK_ENDPOINT = f"{ELASTICSEARCH_URL}/_bulk"
-MAX_WORKERS = 4  # 並列処理するスレッド数
+MAX_WORKERS = 4  # 並列処理するスレッド数（同時に送信中のBulkリクエストの上限）
+# 1回のBulkリクエストの上限。ファイルの大きさに関係なく、この範囲でリクエストを区切る。
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+BULK_MAX_DOCS = int(os.getenv("BULK_MAX_DOCS", "5000"))
+BULK_MAX_RETRIES = 3 # Elasticsearchが429（混雑）を返した場合の再試行回数
 # --- 設定ここまで ---
 
 def _get_auth_headers():
@@ -40,10 +71,177 @@ def _get_auth_headers():
         headers["Authorization"] = f"Basic {encoded_auth}"
     return headers
 
+def _keyword_field():
+    """
+    完全一致の絞り込みと集計に使うフィールドのマッピング。
+    API・バッチのクエリは動的マッピング時代の "<field>.keyword" を参照しているため、
+    親フィールドはインデックス化せず、.keyword サブフィールドだけをkeywordとしてインデックス化する。
+    """
+    return {
+        "type": "keyword",
+        "index": False,
+        "doc_values": False,
+        "fields": {
+            "keyword": {"type": "keyword"}
+        }
+    }
+
+def _stored_only_field():
+    """
+    表示にのみ使い、検索・集計・ソートに使わないフィールドのマッピング（_sourceにのみ保存）。
+    """
+    return {"type": "keyword", "index": False, "doc_values": False}
+
+def _width_mappings():
+    """
+    全角英数字・記号を半角に、半角カナ（濁点・半濁点付きは1文字に合成）を全角にするmapping char_filterの規則。
+    トークン化の後に幅をそろえると半角カナの濁点で文字数が変わり、2文字ずつの位置が検索語とずれるため、
+    トークン化の前に適用する。NFKC正規化から生成し、記号の解釈を避けるため \\uXXXX 形式で書く。
+    """
+    def escape(text):
+        return "".join(f"\\u{ord(ch):04X}" for ch in text)
+
+    mappings = []
+    for code in range(0xFF01, 0xFFEF):
+        char = chr(code)
+        normalized = unicodedata.normalize("NFKC", char)
+        if normalized != char and len(normalized) == 1:
+            mappings.append(f"{escape(char)}=>{escape(normalized)}")
+    for code in range(0xFF66, 0xFF9E):
+        for mark in ("\uFF9E", "\uFF9F"):
+            combined = unicodedata.normalize("NFKC", chr(code) + mark)
+            if len(combined) == 1:
+                mappings.append(f"{escape(chr(code) + mark)}=>{escape(combined)}")
+    return mappings
+
+def build_index_template(index_name):
+    """
+    チャットログ用のインデックステンプレートを生成する。
+    - 既定の /search のソート（timestamp降順）でインデックスをソートし、上位の件数が揃った時点で打ち切れるようにする
+    - スコアを使わないため、messageのnormsは無効にする
+    - 想定外のフィールドは_sourceにのみ保存し、動的マッピングで解析対象が増えないようにする
+    - 完全一致検索用に、messageを2文字ずつに分割した message.bigram を位置情報付きでインデックス化する
+      （kuromojiの分かち書きに左右されない部分文字列検索になる）
+    """
+    return {
+        "index_patterns": [f"{index_name}*"],
+        "priority": 100,
+        "version": CHAT_LOGS_TEMPLATE_VERSION,
+        "template": {
+            "settings": {
+                "index": {
+                    "sort.field": "timestamp",
+                    "sort.order": "desc"
+                },
+                "analysis": {
+                    "char_filter": {
+                        "emoji_char_filter": {
+                            "type": "pattern_replace",
+                            "pattern": ":_?([a-zA-Z0-9_]+):",
+                            "replacement": "customemojitoken$1"
+                        },
+                        "width_char_filter": {
+                            "type": "mapping",
+                            "mappings": _width_mappings()
+                        }
+                    },
+                    "tokenizer": {
+                        "bigram_tokenizer": {
+                            "type": "ngram",
+                            "min_gram": 2,
+                            "max_gram": 2
+                        }
+                    },
+                    "analyzer": {
+                        "emoji_analyzer": {
+                            "type": "custom",
+                            "char_filter": ["emoji_char_filter"],
+                            "tokenizer": "kuromoji_tokenizer"
+                        },
+                        "bigram_analyzer": {
+                            "type": "custom",
+                            "char_filter": ["width_char_filter"],
+                            "tokenizer": "bigram_tokenizer",
+                            "filter": ["lowercase"]
+                        }
+                    }
+                }
+            },
+            "mappings": {
+                "dynamic": False,
+                "properties": {
+                    "id": {"type": "keyword"},
+                    "videoId": _keyword_field(),
+                    "videoTitle": _stored_only_field(),
+                    "type": _keyword_field(),
+                    "message_type": _keyword_field(),
+                    "message": {
+                        "type": "text",
+                        "analyzer": "emoji_analyzer",
+                        "norms": False,
+                        "fields": {
+                            "bigram": {
+                                "type": "text",
+                                "analyzer": "bigram_analyzer",
+                                "index_options": "positions",
+                                "norms": False
+                            }
+                        }
+                    },
+                    "timestamp": {"type": "date", "format": "epoch_millis"},
+                    "elapsedTime": _stored_only_field(),
+                    "datetime": _stored_only_field(),
+                    "authorName": _keyword_field(),
+                    "authorChannelId": _keyword_field(),
+                    "money": {
+                        "properties": {
+                            "amount": {"type": "float"},
+                            "currency": {"type": "keyword"}
+                        }
+                    },
+                    "body_background_colour": _stored_only_field()
+                }
+            }
+        }
+    }
+
+def put_index_template(index_name, es_url):
+    """
+    チャットログ用のインデックステンプレートを登録する。
+    登録済みのテンプレートのversionが CHAT_LOGS_TEMPLATE_VERSION 以上の場合は何もしない。
+    テンプレートは新しく作成されるインデックスにのみ適用されるため、既存のインデックスに反映するには再インデックスが必要。
+    登録済み・登録できた場合はTrue、失敗した場合はFalseを返す。
+    失敗したまま書き込むと、アナライザーのない動的マッピングのインデックスが作成されてしまうため、呼び出し元は処理を中止する。
+    """
+    template_name = f"{index_name}-template"
+    template_url = f"{es_url}/_index_template/{template_name}"
+    headers = _get_auth_headers()
+    headers["Content-Type"] = "application/json"
+    try:
+        response = requests.get(template_url, headers=headers, verify=ELASTICSEARCH_CA)
+        if response.status_code == 200:
+            templates = response.json().get("index_templates", [])
+            current_version = templates[0]["index_template"].get("version", 0) if templates else 0
+            if current_version >= CHAT_LOGS_TEMPLATE_VERSION:
+                print(f"Index template '{template_name}' is up to date (version {current_version}).")
+                return True
+        elif response.status_code != 404:
+            print(f"Unexpected status code when checking index template '{template_name}': {response.status_code}")
+            return False
+        put_response = requests.put(
+            template_url, headers=headers, json=build_index_template(index_name), verify=ELASTICSEARCH_CA
+        )
+        put_response.raise_for_status()
+        print(f"Index template '{template_name}' updated to version {CHAT_LOGS_TEMPLATE_VERSION}.")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"Error checking/updating index template '{template_name}': {e}")
+        return False
+
 def create_index_if_not_exists(index_name, es_url):
     """
-    指定されたインデックスが存在しない場合、レプリカ数を0に設定して作成する。
-    Elasticsearch Serverlessではレプリカ数の設定は不要だが、互換性のため残す。
+    指定されたインデックスが存在しない場合、作成する。
+    設定とマッピングはインデックステンプレート（put_index_template）から適用される。
     """
     index_url = f"{es_url}/{index_name}"
     headers = _get_auth_headers()
@@ -51,39 +249,213 @@ def create_index_if_not_exists(index_name, es_url):
         response = requests.head(index_url, headers=headers, verify=ELASTICSEARCH_CA) # インデックスの存在を確認
         if response.status_code == 404: # インデックスが存在しない場合
             print(f"Index '{index_name}' does not exist. Creating...")
-            # Serverlessではレプリカ数の設定は無視されるか、エラーになる可能性があるため、設定を削除
-            # アナライザー設定を追加
+            create_response = requests.put(index_url, headers=headers, verify=ELASTICSEARCH_CA)
+            create_response.raise_for_status()
+            print(f"Index '{index_name}' created successfully from the index template.")
+        elif response.status_code == 200:
+            print(f"Index '{index_name}' already exists.")
+        else:
+            print(f"Unexpected status code when checking index '{index_name}': {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Error checking/creating index '{index_name}': {e}")
+
+def bump_index_generation(index_name, es_url):
+    """
+    インポート完了をAPIに知らせるため、メタインデックスの世代マーカーを更新する。
+    APIはこの値の変化を検知して、投稿者名などのキャッシュを破棄する。
+    """
+    doc_url = f"{es_url}/{META_INDEX_NAME}/_doc/{index_name}"
+    doc = {
+        "generation": int(time.time() * 1000),
+        "updatedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    headers = _get_auth_headers()
+    headers["Content-Type"] = "application/json"
+    try:
+        response = requests.put(doc_url, headers=headers, json=doc, verify=ELASTICSEARCH_CA)
+        response.raise_for_status()
+        print(f"Index generation for '{index_name}' bumped to {doc['generation']}.")
+    except requests.exceptions.RequestException as e:
+        print(f"Error bumping index generation for '{index_name}': {e}")
+
+def is_partitioned():
+    return PARTITION in ("month", "quarter")
+
+def partition_index_name(index_name, timestamp_ms):
+    """
+    timestamp（ミリ秒）に対応するパーティションのインデックス名を返す（UTC基準）。
+    APIの chat_logs_partition_name と同じ規則にする。
+    """
+    dt = datetime.fromtimestamp((timestamp_ms or 0) / 1000, tz=timezone.utc)
+    if PARTITION == "quarter":
+        return f"{index_name}-{dt.year}.q{(dt.month - 1) // 3 + 1}"
+    return f"{index_name}-{dt.year}.{dt.month:02d}"
+
+def is_routed():
+    return ROUTING == "videoId"
+
+def bulk_action(index_name, doc, partitions=None):
+    """
+    1件のドキュメントに対するBulk APIのアクション行を生成する。
+    idフィールド（チャットはchat-downloaderのmessage_id、字幕はvtt_to_csv.pyのgenerate_id）をドキュメントIDにし、
+    IMPORT_MODEが"overwrite"でなければ、登録済みのドキュメントを上書きしないcreateアクションにする。
+    期間パーティションが有効な場合はtimestampから書き込み先を決め、partitionsに追加する。
+    ルーティングが有効な場合はvideoIdをルーティングキーにする。
+    """
+    meta = {"_index": index_name}
+    if doc.get("id"):
+        meta["_id"] = doc["id"]
+    if is_partitioned():
+        meta["_index"] = partition_index_name(index_name, doc.get("timestamp"))
+        if partitions is not None:
+            partitions.add(meta["_index"])
+    if is_routed() and doc.get("videoId"):
+        meta["routing"] = doc["videoId"]
+    op_type = "index" if IMPORT_MODE == "overwrite" or "_id" not in meta else "create"
+    return json.dumps({op_type: meta})
+
+def add_author_stats(author_stats, doc):
+    """
+    1件のドキュメントを投稿者ごとの集計（authorChannelId -> 名前・最初/最後の投稿時刻・メッセージ数）に加える。
+    """
+    channel_id = doc.get("authorChannelId")
+    if not channel_id:
+        return
+    timestamp = doc.get("timestamp") or 0
+    stats = author_stats.get(channel_id)
+    if stats is None:
+        stats = author_stats[channel_id] = {
+            "names": [], "latestName": None, "firstSeen": timestamp, "lastSeen": timestamp, "messageCount": 0
+        }
+    name = doc.get("authorName")
+    if name and name not in stats["names"]:
+        stats["names"].append(name)
+    if name and (stats["latestName"] is None or timestamp >= stats["lastSeen"]):
+        stats["latestName"] = name
+    stats["firstSeen"] = min(stats["firstSeen"], timestamp)
+    stats["lastSeen"] = max(stats["lastSeen"], timestamp)
+    stats["messageCount"] += 1
+
+def author_fields(doc):
+    """
+    投稿者インデックスの集計（add_author_stats）に必要なフィールドだけを取り出す。
+    """
+    fields = {key: doc.get(key) for key in ("authorChannelId", "authorName")}
+    # epoch_millisは文字列でもインデックスできるため、集計用に数値にそろえる
+    try:
+        fields["timestamp"] = int(doc.get("timestamp") or 0)
+    except (TypeError, ValueError):
+        fields["timestamp"] = 0
+    return fields
+
+def generate_bulk_actions(file_path, index_name, partitions=None):
+    """
+    単一のNDJSONファイルを1行ずつ読み、(アクション行, ドキュメント行, 投稿者の集計用フィールド) の組を返すジェネレーター。
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            doc = json.loads(line)
+            yield bulk_action(index_name, doc, partitions), line, author_fields(doc)
+
+def check_alias_available(index_name, es_url):
+    """
+    期間パーティションの読み取り用エイリアスとしてindex_nameを使えるか確認する。
+    同名の通常のインデックスが存在する場合、エイリアスは作成できないため移行が必要。
+    """
+    headers = _get_auth_headers()
+    try:
+        response = requests.get(f"{es_url}/_alias/{index_name}", headers=headers, verify=ELASTICSEARCH_CA)
+        if response.status_code == 200:
+            return True
+        exists = requests.head(f"{es_url}/{index_name}", headers=headers, verify=ELASTICSEARCH_CA)
+        if exists.status_code == 200:
+            print(
+                f"Index '{index_name}' exists as a concrete index and cannot be used as the partition alias. "
+                f"Run this script with '--reindex-from {index_name} --swap' to move it into '{index_name}-*' partitions."
+            )
+            return False
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"Error checking alias '{index_name}': {e}")
+        return False
+
+def update_read_alias(index_name, es_url):
+    """
+    全てのパーティション（"<index_name>-*"）を読み取り用エイリアスindex_nameに追加する。
+    """
+    headers = _get_auth_headers()
+    headers["Content-Type"] = "application/json"
+    actions = {"actions": [{"add": {"index": f"{index_name}-*", "alias": index_name}}]}
+    try:
+        response = requests.post(f"{es_url}/_aliases", headers=headers, json=actions, verify=ELASTICSEARCH_CA)
+        response.raise_for_status()
+        print(f"Alias '{index_name}' now points to all '{index_name}-*' partitions.")
+    except requests.exceptions.RequestException as e:
+        print(f"Error updating alias '{index_name}': {e}")
+
+def forcemerge_old_partitions(index_name, es_url, written_partitions):
+    """
+    今回書き込みのなかった過去のパーティションを1セグメントにforce mergeする。
+    書き込みの終わったパーティションはセグメントが少ないほど検索が速く、以降は変更されない。
+    """
+    headers = _get_auth_headers()
+    current = partition_index_name(index_name, int(time.time() * 1000))
+    try:
+        response = requests.get(
+            f"{es_url}/_cat/indices/{index_name}-*?format=json&h=index",
+            headers=headers,
+            verify=ELASTICSEARCH_CA
+        )
+        response.raise_for_status()
+        partitions = sorted(row["index"] for row in response.json())
+    except requests.exceptions.RequestException as e:
+        print(f"Error listing partitions of '{index_name}': {e}")
+        return
+    for partition in partitions:
+        if partition >= current or partition in written_partitions:
+            continue
+        try:
+            merge_response = requests.post(
+                f"{es_url}/{partition}/_forcemerge?max_num_segments=1",
+                headers=headers,
+                timeout=3600,
+                verify=ELASTICSEARCH_CA
+            )
+            merge_response.raise_for_status()
+            print(f"Force merged partition '{partition}'.")
+        except requests.exceptions.RequestException as e:
+            print(f"Error force merging partition '{partition}': {e}")
+
+def create_authors_index_if_not_exists(index_name, es_url):
+    """
+    投稿者インデックスが存在しない場合、作成する。ドキュメントIDはauthorChannelId。
+    """
+    index_url = f"{es_url}/{index_name}"
+    headers = _get_auth_headers()
+    headers["Content-Type"] = "application/json"
+    try:
+        response = requests.head(index_url, headers=headers, verify=ELASTICSEARCH_CA)
+        if response.status_code == 404:
+            print(f"Index '{index_name}' does not exist. Creating...")
             settings = {
-                "settings": {
-                    "analysis": {
-                        "char_filter": {
-                            "emoji_char_filter": {
-                                "type": "pattern_replace",
-                                "pattern": ":_?([a-zA-Z0-9_]+):",
-                                "replacement": "customemojitoken$1"
-                            }
-                        },
-                        "analyzer": {
-                            "emoji_analyzer": {
-                                "type": "custom",
-                                "char_filter": ["emoji_char_filter"],
-                                "tokenizer": "kuromoji_tokenizer"
-                            }
-                        }
-                    }
-                },
                 "mappings": {
+                    "dynamic": False,
                     "properties": {
-                        "message": {
-                            "type": "text",
-                            "analyzer": "emoji_analyzer"
-                        }
+                        "authorChannelId": {"type": "keyword"},
+                        "names": {"type": "keyword"},
+                        "latestName": {"type": "keyword"},
+                        "firstSeen": {"type": "date", "format": "epoch_millis"},
+                        "lastSeen": {"type": "date", "format": "epoch_millis"},
+                        "messageCount": {"type": "long"}
                     }
                 }
             }
             create_response = requests.put(index_url, headers=headers, json=settings, verify=ELASTICSEARCH_CA)
             create_response.raise_for_status()
-            print(f"Index '{index_name}' created successfully with custom analyzer.")
+            print(f"Index '{index_name}' created successfully.")
         elif response.status_code == 200:
             print(f"Index '{index_name}' already exists.")
         else:
@@ -91,25 +463,222 @@ def create_index_if_not_exists(index_name, es_url):
     except requests.exceptions.RequestException as e:
         print(f"Error checking/creating index '{index_name}': {e}")
 
-def generate_bulk_payload(file_path, index_name):
+# 投稿者ドキュメントに1ファイル分の集計を加えるスクリプト
+MERGE_AUTHOR_SCRIPT = """
+for (name in params.names) {
+    if (!ctx._source.names.contains(name)) {
+        ctx._source.names.add(name);
+    }
+}
+if (params.lastSeen >= ctx._source.lastSeen && params.latestName != null) {
+    ctx._source.latestName = params.latestName;
+}
+ctx._source.firstSeen = Math.min(ctx._source.firstSeen, params.firstSeen);
+ctx._source.lastSeen = Math.max(ctx._source.lastSeen, params.lastSeen);
+ctx._source.messageCount += params.messageCount;
+"""
+
+def _post_author_actions(lines):
+    response = requests.post(
+        BULK_ENDPOINT,
+        data=("\n".join(lines) + "\n").encode("utf-8"),
+        headers=_get_auth_headers(),
+        timeout=60,
+        verify=ELASTICSEARCH_CA
+    )
+    response.raise_for_status()
+    resp_json = response.json()
+    if not resp_json.get("errors"):
+        return 0
+    return sum(1 for item in resp_json.get("items", []) if next(iter(item.values())).get("error"))
+
+def update_authors(author_stats, index_name):
     """
-    単一のNDJSONファイルからBulk API用のペイロード文字列を生成する。
+    1ファイル分の投稿者ごとの集計を投稿者インデックスに反映する（未登録の投稿者は作成する）。
+    並列に処理している他のファイルと同じ投稿者を更新することがあるため、競合時は再試行する。
+    メッセージ数は加算するため、IDのないメッセージを含むファイルを再インポートすると二重に数えられる。その場合は --rebuild-authors で作り直す。
     """
     lines = []
-    action_meta = json.dumps({"index": {"_index": index_name}})
+    failed = 0
+    for channel_id, stats in author_stats.items():
+        lines.append(json.dumps({"update": {"_index": index_name, "_id": channel_id, "retry_on_conflict": 5}}))
+        lines.append(json.dumps({
+            "script": {"lang": "painless", "source": MERGE_AUTHOR_SCRIPT, "params": stats},
+            "upsert": {"authorChannelId": channel_id, **stats}
+        }, ensure_ascii=False))
+        if len(lines) >= AUTHORS_BATCH_SIZE * 2:
+            failed += _post_author_actions(lines)
+            lines = []
+    if lines:
+        failed += _post_author_actions(lines)
+    return failed
+
+def rebuild_authors(chat_logs_index, index_name, es_url):
+    """
+    チャットログ全体から投稿者インデックスを作り直す。
+    既存のデータの取り込みや、再インポートでメッセージ数がずれた場合に使う。
+    """
+    headers = _get_auth_headers()
+    headers["Content-Type"] = "application/json"
+    create_authors_index_if_not_exists(index_name, es_url)
+    author_stats = {}
+    after_key = None
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    lines.append(action_meta)
-                    lines.append(line)
-        if not lines:
-            return None
-        return "\n".join(lines) + "\n"
-    except Exception as e:
-        print(f"Error reading file {os.path.basename(file_path)}: {e}")
-        return None
+        while True:
+            composite = {
+                "size": AUTHORS_BATCH_SIZE,
+                "sources": [
+                    {"channel": {"terms": {"field": "authorChannelId.keyword"}}},
+                    {"name": {"terms": {"field": "authorName.keyword"}}},
+                ],
+            }
+            if after_key:
+                composite["after"] = after_key
+            response = requests.post(
+                f"{es_url}/{chat_logs_index}/_search",
+                headers=headers,
+                json={
+                    "size": 0,
+                    "aggs": {"authors": {
+                        "composite": composite,
+                        "aggs": {
+                            "first": {"min": {"field": "timestamp"}},
+                            "last": {"max": {"field": "timestamp"}}
+                        }
+                    }}
+                },
+                timeout=600,
+                verify=ELASTICSEARCH_CA
+            )
+            response.raise_for_status()
+            agg = response.json()["aggregations"]["authors"]
+            for bucket in agg["buckets"]:
+                channel_id, name = bucket["key"]["channel"], bucket["key"]["name"]
+                first, last = int(bucket["first"]["value"] or 0), int(bucket["last"]["value"] or 0)
+                stats = author_stats.get(channel_id)
+                if stats is None:
+                    stats = author_stats[channel_id] = {
+                        "authorChannelId": channel_id, "names": [], "latestName": name,
+                        "firstSeen": first, "lastSeen": last, "messageCount": 0
+                    }
+                stats["names"].append(name)
+                if last >= stats["lastSeen"]:
+                    stats["latestName"] = name
+                stats["firstSeen"] = min(stats["firstSeen"], first)
+                stats["lastSeen"] = max(stats["lastSeen"], last)
+                stats["messageCount"] += bucket["doc_count"]
+            after_key = agg.get("after_key")
+            if not after_key or len(agg["buckets"]) < AUTHORS_BATCH_SIZE:
+                break
+    except requests.exceptions.RequestException as e:
+        print(f"Error aggregating authors from '{chat_logs_index}': {e}")
+        return False
+
+    failed = 0
+    authors = list(author_stats.values())
+    try:
+        for i in range(0, len(authors), AUTHORS_BATCH_SIZE):
+            lines = []
+            for stats in authors[i:i + AUTHORS_BATCH_SIZE]:
+                lines.append(json.dumps({"index": {"_index": index_name, "_id": stats["authorChannelId"]}}))
+                lines.append(json.dumps(stats, ensure_ascii=False))
+            failed += _post_author_actions(lines)
+    except requests.exceptions.RequestException as e:
+        print(f"Error writing authors to '{index_name}': {e}")
+        return False
+    print(f"Rebuilt '{index_name}' with {len(authors) - failed} authors ({failed} failed).")
+    return failed == 0
+
+# 再インデックス時に書き込み先のパーティションとルーティングを決めるスクリプト（bulk_actionと同じ規則）
+REINDEX_SCRIPT = """
+if (params.partition != 'none') {
+    ZonedDateTime dt = ZonedDateTime.ofInstant(
+        Instant.ofEpochMilli(((Number) ctx._source.timestamp).longValue()), ZoneId.of('Z'));
+    int month = dt.getMonthValue();
+    if (params.partition == 'quarter') {
+        ctx._index = params.index + '-' + dt.getYear() + '.q' + ((month - 1) / 3 + 1);
+    } else {
+        ctx._index = params.index + '-' + dt.getYear() + '.' + (month < 10 ? '0' : '') + month;
+    }
+}
+if (params.routed && ctx._source.videoId != null) {
+    ctx._routing = ctx._source.videoId;
+}
+"""
+
+def reindex_index(source, index_name, es_url, swap=False):
+    """
+    既存のインデックスsourceを、現在のテンプレート・期間パーティション・ルーティングの設定で再インデックスする。
+    書き込み先は、期間パーティションが有効な場合は "<index_name>-*" のパーティション、
+    それ以外は "<index_name>_v<テンプレートのバージョン>"。
+    期間パーティションではスクリプトがドキュメントごとに書き込み先（ctx._index）を決めるが、
+    Elasticsearchは読み込み元と同じdestを拒否するため、destには使われない "<index_name>_reindex" を指定する。
+    swapを指定すると、完了後にsourceを削除し、index_nameを書き込み先のエイリアスに付け替える（1回の_aliases呼び出しで切り替える）。
+    """
+    headers = _get_auth_headers()
+    headers["Content-Type"] = "application/json"
+    destination = f"{index_name}_reindex" if is_partitioned() else f"{index_name}_v{CHAT_LOGS_TEMPLATE_VERSION}"
+    if source == destination:
+        print(
+            f"Cannot reindex '{source}' into itself (destination '{destination}'). "
+            f"Reindex from another index, or raise CHAT_LOGS_TEMPLATE_VERSION first."
+        )
+        return False
+    if not put_index_template(index_name, es_url):
+        return False
+    body = {
+        "source": {"index": source},
+        "dest": {"index": destination},
+        "script": {
+            "lang": "painless",
+            "source": REINDEX_SCRIPT,
+            "params": {"index": index_name, "partition": PARTITION if is_partitioned() else "none", "routed": is_routed()}
+        }
+    }
+    try:
+        response = requests.post(
+            f"{es_url}/_reindex?wait_for_completion=false&slices=auto",
+            headers=headers, json=body, verify=ELASTICSEARCH_CA
+        )
+        response.raise_for_status()
+        task_id = response.json()["task"]
+        target_description = f"'{index_name}-*' partitions" if is_partitioned() else f"'{destination}'"
+        print(f"Reindexing '{source}' into {target_description} (task {task_id})...")
+        while True:
+            time.sleep(10)
+            task_response = requests.get(f"{es_url}/_tasks/{task_id}", headers=headers, verify=ELASTICSEARCH_CA)
+            task_response.raise_for_status()
+            task = task_response.json()
+            status = task.get("task", {}).get("status", {})
+            print(f"  {status.get('created', 0) + status.get('updated', 0)} / {status.get('total', 0)} docs")
+            if task.get("completed"):
+                break
+    except requests.exceptions.RequestException as e:
+        print(f"Error reindexing '{source}': {e}")
+        return False
+
+    failures = task.get("response", {}).get("failures") or task.get("error")
+    if failures:
+        print(f"Reindex of '{source}' failed: {failures}")
+        return False
+    print(f"Reindex of '{source}' finished.")
+    if not swap:
+        return True
+
+    target = f"{index_name}-*" if is_partitioned() else destination
+    actions = {"actions": [
+        {"add": {"index": target, "alias": index_name}},
+        {"remove_index": {"index": source}}
+    ]}
+    try:
+        response = requests.post(f"{es_url}/_aliases", headers=headers, json=actions, verify=ELASTICSEARCH_CA)
+        response.raise_for_status()
+        print(f"Alias '{index_name}' now points to '{target}'. Index '{source}' was deleted.")
+    except requests.exceptions.RequestException as e:
+        print(f"Error swapping alias '{index_name}': {e}")
+        return False
+    bump_index_generation(index_name, es_url)
+    return True
 
 def _move_local_file(source_path, destination_dir):
     """
@@ -126,62 +695,216 @@ def _move_local_file(source_path, destination_dir):
     except Exception as e:
         print(f"Error moving file {source_path} to {destination_dir}: {e}")
 
-def send_to_elasticsearch(payload, file_path):
+def send_bulk_request(entries, doc_files):
     """
-    生成されたペイロードをElasticsearchに送信する。
-    データストアのタイプに応じて、成功または失敗したファイルを移動する。
+    ドキュメントごとのBulk APIの行（アクション行とドキュメント行）のリストを1回のBulkリクエストとして送信し、
+    (失敗したファイル -> 最初のエラー内容, 新しく作成されたドキュメントの番号のリスト, 登録済みでスキップしたファイル -> 件数) を返す。
+    doc_filesは、entriesと同じ順にそれぞれの読み込み元ファイルを並べたリスト。
+    Elasticsearchが429（混雑）を返した場合は、リクエスト全体・ドキュメント単位のどちらでも、間隔を空けてその分だけ再試行する。
     """
-    filename = os.path.basename(file_path)
-    if not payload:
-        _move_local_file(file_path, LOCAL_CHAT_LOGS_ERROR_DIR)
-        return f"Skipped (empty or read error): {filename}"
-
-    headers = _get_auth_headers()
-    success = False
-    result_message = ""
-
-    try:
+    failures, created, skipped = {}, [], {}
+    pending = list(range(len(entries)))
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        can_retry = attempt < BULK_MAX_RETRIES
         response = requests.post(
             BULK_ENDPOINT,
-            data=payload.encode('utf-8'),
-            headers=headers,
+            data=b"".join(entries[i] for i in pending),
+            headers=_get_auth_headers(),
             timeout=60,
             verify=ELASTICSEARCH_CA
         )
+        if response.status_code == 429 and can_retry:
+            time.sleep(2 ** attempt)
+            continue
         response.raise_for_status()
-        
-        resp_json = response.json()
-        if resp_json.get("errors"):
-            for item in resp_json.get("items", []):
-                if item.get("index", {}).get("error"):
-                    error_reason = item["index"]["error"].get("reason", "Unknown error")
-                    result_message = f"Failed: {filename} - Reason: {error_reason}"
-                    break
-            else:
-                result_message = f"Failed: {filename} - Unknown error in response."
-            success = False
-        else:
-            count = len(resp_json.get("items", []))
-            result_message = f"Success: {filename} ({count} docs)"
-            success = True
-            
-    except requests.exceptions.RequestException as e:
-        result_message = f"Failed (RequestException): {filename} - {e}"
-        success = False
-    except Exception as e:
-        result_message = f"Failed (Exception): {filename} - {e}"
-        success = False
 
-    # 処理結果に基づいてファイルを移動
+        rejected = []
+        for i, item in zip(pending, response.json().get("items", [])):
+            file_path = doc_files[i]
+            result = next(iter(item.values()))
+            error = result.get("error")
+            if not error:
+                if result.get("result") == "created":
+                    created.append(i)
+            elif result.get("status") == 429 and can_retry:
+                rejected.append(i)
+            elif result.get("status") == 409:
+                # createアクションで登録済みのメッセージ（再インポート）
+                skipped[file_path] = skipped.get(file_path, 0) + 1
+            elif file_path not in failures:
+                failures[file_path] = error.get("reason", "Unknown error") if isinstance(error, dict) else str(error)
+        if not rejected:
+            break
+        pending = rejected
+        time.sleep(2 ** attempt)
+    return failures, created, skipped
+
+def finish_file(file_path, state):
+    """
+    ファイルの全ドキュメントの送信が終わった後に呼ばれ、結果に応じてファイルを移動する。
+    ファイルの投稿者ごとの集計（新しく作成されたドキュメントの分）は、ファイルの一部が失敗した場合も投稿者インデックスに反映する。
+    反映しないと、再試行時にそれらのドキュメントは作成済み（409）となり、二度と集計されない。
+    """
+    filename = os.path.basename(file_path)
+    if state["error"]:
+        result_message = f"Failed: {filename} - Reason: {state['error']}"
+    elif state["docs"] == 0:
+        result_message = f"Skipped (empty): {filename}"
+    else:
+        result_message = f"Success: {filename} ({state['docs']} docs"
+        if state["skipped"]:
+            result_message += f", {state['skipped']} already imported"
+        result_message += ")"
+    if state["authors_error"]:
+        result_message += f" - Failed to collect author stats (run --rebuild-authors): {state['authors_error']}"
+    elif state["authors"]:
+        try:
+            failed_authors = update_authors(state["authors"], AUTHORS_INDEX_NAME)
+            if failed_authors:
+                result_message += f" - {failed_authors} authors failed to update"
+        except requests.exceptions.RequestException as e:
+            result_message += f" - Failed to update authors: {e}"
+    print(result_message)
+
+    success = not state["error"] and state["docs"] > 0
     destination_dir = LOCAL_CHAT_LOGS_PROCESSED_DIR if success else LOCAL_CHAT_LOGS_ERROR_DIR
     _move_local_file(file_path, destination_dir)
-        
-    return result_message
+    return success
+
+def import_files(file_paths, index_name, partitions):
+    """
+    ファイルを順に1行ずつ読み、BULK_MAX_BYTES / BULK_MAX_DOCS ごとに区切ったBulkリクエストとして送信する。
+    投稿者インデックスには新しく作成されたドキュメントだけを集計するため、再インポートしてもメッセージ数は増えない。
+    送信中のリクエストはMAX_WORKERS件までに制限するため、メモリ使用量はファイルの大きさや数によらず一定になる。
+    1つのファイルが複数のリクエストにまたがる場合もあり、全てのリクエストが完了した時点でファイルを移動する。
+    成功したファイル数を返す。
+    """
+    lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(MAX_WORKERS)
+    files = {}
+    success_count = 0
+
+    def finish(file_path):
+        nonlocal success_count
+        # 完了したファイルの状態（投稿者ごとの集計を含む）は残さない
+        with lock:
+            state = files.pop(file_path)
+        try:
+            success = finish_file(file_path, state)
+        except Exception as e:
+            print(f"An error occurred finishing {os.path.basename(file_path)}: {e}")
+            return
+        if success:
+            with lock:
+                success_count += 1
+
+    def complete(chunk_files, chunk_docs, future):
+        # 例外が起きても、送信中の枠とファイルごとの残りリクエスト数は必ず戻す
+        # （戻さないとファイルが移動されず、MAX_WORKERS回でflush()が止まる）
+        finished = []
+        try:
+            try:
+                failures, created, skipped = future.result()
+            except Exception as e:
+                failures, created, skipped = {file_path: f"{type(e).__name__}: {e}" for file_path in chunk_files}, [], {}
+            with lock:
+                for i in created:
+                    file_path, author_doc = chunk_docs[i]
+                    state = files[file_path]
+                    if state["authors"] is not None and not state["authors_error"]:
+                        try:
+                            add_author_stats(state["authors"], author_doc)
+                        except Exception as e:
+                            state["authors_error"] = f"{type(e).__name__}: {e}"
+                for file_path, count in skipped.items():
+                    files[file_path]["skipped"] += count
+                for file_path in chunk_files:
+                    if file_path in failures and not files[file_path]["error"]:
+                        files[file_path]["error"] = failures[file_path]
+        finally:
+            with lock:
+                for file_path in chunk_files:
+                    state = files[file_path]
+                    state["pending"] -= 1
+                    if state["pending"] == 0 and state["read"]:
+                        finished.append(file_path)
+            in_flight.release()
+        for file_path in finished:
+            finish(file_path)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        lines, docs, size = [], [], 0
+        chunk_files = set()
+
+        def flush():
+            nonlocal lines, docs, size, chunk_files
+            in_flight.acquire()
+            future = executor.submit(send_bulk_request, lines, [file_path for file_path, _ in docs])
+            future.add_done_callback(lambda f, chunk=frozenset(chunk_files), chunk_docs=docs: complete(chunk, chunk_docs, f))
+            lines, docs, size = [], [], 0
+            chunk_files = set()
+
+        for file_path in file_paths:
+            state = {
+                "pending": 0, "read": False, "error": None, "docs": 0, "skipped": 0,
+                "authors": {} if AUTHORS_INDEX_NAME else None, "authors_error": None
+            }
+            files[file_path] = state
+            try:
+                for action, source, author_doc in generate_bulk_actions(file_path, index_name, partitions):
+                    entry = f"{action}\n{source}\n".encode("utf-8")
+                    if lines and (size + len(entry) > BULK_MAX_BYTES or len(docs) >= BULK_MAX_DOCS):
+                        flush()
+                    if file_path not in chunk_files:
+                        chunk_files.add(file_path)
+                        with lock:
+                            state["pending"] += 1
+                    lines.append(entry)
+                    docs.append((file_path, author_doc))
+                    size += len(entry)
+                    state["docs"] += 1
+            except Exception as e:
+                # 読み込み済みの分は送信されるが、ファイルはエラーとして扱う
+                state["error"] = f"Read error: {e}"
+            with lock:
+                state["read"] = True
+                finished = state["pending"] == 0
+            if finished:
+                finish(file_path)
+        if lines:
+            flush()
+
+    return success_count
 
 def main():
     """
-    メイン処理。ローカルディレクトリからJSONファイルを並列で処理する。
+    メイン処理。ローカルディレクトリのJSONファイルを、サイズで区切ったBulkリクエストとして並列に送信する。
+    --reindex-from を指定した場合は、インポートの代わりに既存のインデックスを再インデックスする。
     """
+    parser = argparse.ArgumentParser(description="チャットログをElasticsearchにインポートする")
+    parser.add_argument(
+        "--reindex-from", metavar="SOURCE",
+        help="既存のインデックスSOURCEを現在のテンプレート・期間パーティション・ルーティングの設定で再インデックスする"
+    )
+    parser.add_argument(
+        "--swap", action="store_true",
+        help="再インデックス後にSOURCEを削除し、CHAT_LOGS_INDEX_NAMEを新しいインデックスのエイリアスにする"
+    )
+    parser.add_argument(
+        "--rebuild-authors", action="store_true",
+        help="チャットログ全体から投稿者インデックス（AUTHORS_INDEX_NAME）を作り直す"
+    )
+    args = parser.parse_args()
+    if args.reindex_from:
+        if not reindex_index(args.reindex_from, INDEX_NAME, ELASTICSEARCH_URL, swap=args.swap):
+            sys.exit(1)
+        return
+    if args.rebuild_authors:
+        if not AUTHORS_INDEX_NAME or not rebuild_authors(INDEX_NAME, AUTHORS_INDEX_NAME, ELASTICSEARCH_URL):
+            sys.exit(1)
+        bump_index_generation(INDEX_NAME, ELASTICSEARCH_URL)
+        return
+
     files_to_process = []
 
     if not LOCAL_CHAT_LOGS_DIR or not os.path.isdir(LOCAL_CHAT_LOGS_DIR):
@@ -192,9 +915,18 @@ def main():
         if filename.endswith(('.json', '.ndjson')):
             file_path = os.path.join(LOCAL_CHAT_LOGS_DIR, filename)
             if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
-                files_to_process.append({'path': file_path})
+                files_to_process.append(file_path)
 
-    create_index_if_not_exists(INDEX_NAME, ELASTICSEARCH_URL)
+    if not put_index_template(INDEX_NAME, ELASTICSEARCH_URL):
+        sys.exit(1)
+    if is_partitioned():
+        # パーティションはBulk APIでの書き込み時にテンプレートから自動作成される
+        if not check_alias_available(INDEX_NAME, ELASTICSEARCH_URL):
+            sys.exit(1)
+    else:
+        create_index_if_not_exists(INDEX_NAME, ELASTICSEARCH_URL)
+    if AUTHORS_INDEX_NAME:
+        create_authors_index_if_not_exists(AUTHORS_INDEX_NAME, ELASTICSEARCH_URL)
 
     if not files_to_process:
         print("No non-empty JSON files to process.")
@@ -202,23 +934,16 @@ def main():
 
     print(f"Found {len(files_to_process)} files to process. Starting import to index '{INDEX_NAME}'...")
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_file = {
-            executor.submit(
-                send_to_elasticsearch,
-                generate_bulk_payload(file_info['path'], INDEX_NAME),
-                file_info['path']
-            ): os.path.basename(file_info['path']) for file_info in files_to_process
-        }
-
-        for future in as_completed(future_to_file):
-            try:
-                result = future.result()
-                print(result)
-            except Exception as exc:
-                print(f"An error occurred processing {future_to_file[future]}: {exc}")
+    written_partitions = set()
+    success_count = import_files(sorted(files_to_process), INDEX_NAME, written_partitions)
 
     print("\nImport process finished.")
+    if is_partitioned():
+        update_read_alias(INDEX_NAME, ELASTICSEARCH_URL)
+        if FORCEMERGE_OLD_PARTITIONS:
+            forcemerge_old_partitions(INDEX_NAME, ELASTICSEARCH_URL, written_partitions)
+    if success_count > 0:
+        bump_index_generation(INDEX_NAME, ELASTICSEARCH_URL)
     try:
         count_url = f"{ELASTICSEARCH_URL}/{INDEX_NAME}/_count"
         response = requests.get(count_url, headers=_get_auth_headers(), verify=ELASTICSEARCH_CA)
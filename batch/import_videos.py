@@ -4,6 +4,8 @@ import json
 from urllib.parse import urlparse, parse_qs
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import base64
+import time
+from datetime import datetime, timezone
 
 # --- 設定 ---
 ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL")
@@ -13,6 +15,8 @@ LOCAL_NDJSON_FILE = os.getenv('VIDEOS_NDJSON')
 ELASTICSEARCH_CA = os.getenv('ELASTICSEARCH_CA') # 証明書ファイル名
 ELASTICSEARCH_ADMIN = os.getenv('ELASTICSEARCH_ADMIN')
 ELASTICSEARCH_PASSWORD = os.getenv('ELASTICSEARCH_PASSWORD')
+# APIのキャッシュ破棄に使う世代マーカーを保存するインデックス
+META_INDEX_NAME = os.getenv("META_INDEX_NAME", "utsulog-meta")
 
 # ELASTICSEARCH_URLが設定されていない場合はエラー
 if not ELASTICSEARCH_URL:
@@ -59,6 +63,25 @@ def create_index_if_not_exists(index_name, es_url):
     except requests.exceptions.RequestException as e:
         print(f"Error checking/creating index '{index_name}': {e}")
 
+def bump_index_generation(index_name, es_url):
+    """
+    インポート完了をAPIに知らせるため、メタインデックスの世代マーカーを更新する。
+    APIはこの値の変化を検知して、動画一覧のスナップショットを読み直す。
+    """
+    doc_url = f"{es_url}/{META_INDEX_NAME}/_doc/{index_name}"
+    doc = {
+        "generation": int(time.time() * 1000),
+        "updatedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    headers = _get_auth_headers()
+    headers["Content-Type"] = "application/json"
+    try:
+        response = requests.put(doc_url, headers=headers, json=doc, verify=ELASTICSEARCH_CA)
+        response.raise_for_status()
+        print(f"Index generation for '{index_name}' bumped to {doc['generation']}.")
+    except requests.exceptions.RequestException as e:
+        print(f"Error bumping index generation for '{index_name}': {e}")
+
 def extract_video_id(video_info):
     """
     動画情報からvideo_idを抽出する
@@ -171,14 +194,19 @@ def main():
                 if payload:
                     futures.append(executor.submit(send_to_elasticsearch, payload, chunk_index))
         
+        success_count = 0
         for future in as_completed(futures):
             try:
                 result = future.result()
                 print(result)
+                if result.startswith("Success"):
+                    success_count += 1
             except Exception as exc:
                 print(f"An error occurred during processing a chunk: {exc}")
 
     print("\nImport process finished.")
+    if success_count > 0:
+        bump_index_generation(INDEX_NAME, ELASTICSEARCH_URL)
     try:
         count_url = f"{ELASTICSEARCH_URL}/{INDEX_NAME}/_count"
         response = requests.get(count_url, headers=_get_auth_headers(), verify=ELASTICSEARCH_CA)
@@ -14,6 +14,8 @@ echo "Running import_videos.py..."
 python batch/import_videos.py
 echo "Running import_chatlogs.py..."
 python batch/import_chatlogs.py
+echo "Running build_timeline_rollups.py..."
+python batch/build_timeline_rollups.py
 echo "Running dl_video.py..."
 python batch/dl_video.py
 echo "Running gen_thumbnails.py..."
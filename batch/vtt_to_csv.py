@@ -213,6 +213,8 @@ def main():
                 # timestamp = actualStartTime + elapsed (start_ms)
                 abs_timestamp = base_timestamp + start_ms
                 
+                # videoId is also the routing key when importing with CHAT_LOGS_ROUTING=videoId,
+                # so every record of a transcript must carry it.
                 record = {
                     "videoId": video_id,
                     "videoTitle": video_title,
@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import axios from 'axios';
 import VideoFilter from './components/VideoFilter';
 import InquiryModal from './components/InquiryModal';
@@ -16,6 +16,39 @@ interface Video {
   actualStartTime: string;
 }
 
+// localStorageに保持する動画一覧キャッシュの型定義
+interface CachedVideos {
+  videos: Video[];
+  latest: string | null;
+  fetchedAt: number;
+}
+
+const VIDEOS_CACHE_KEY = 'utsulog.videos';
+// タイトル変更などを取り込むため、この期間を過ぎたら差分ではなく全件を取得し直す
+const VIDEOS_CACHE_MAX_AGE_MS = 24 * 60 * 60 * 1000;
+
+const loadCachedVideos = (): CachedVideos | null => {
+  try {
+    const raw = localStorage.getItem(VIDEOS_CACHE_KEY);
+    if (!raw) return null;
+    const cached: CachedVideos = JSON.parse(raw);
+    if (!Array.isArray(cached.videos) || Date.now() - cached.fetchedAt > VIDEOS_CACHE_MAX_AGE_MS) {
+      return null;
+    }
+    return cached;
+  } catch {
+    return null;
+  }
+};
+
+const saveCachedVideos = (cached: CachedVideos) => {
+  try {
+    localStorage.setItem(VIDEOS_CACHE_KEY, JSON.stringify(cached));
+  } catch {
+    // 容量超過などで保存できない場合は次回全件取得する
+  }
+};
+
 // APIから返される検索結果の型定義
 interface SearchResult {
   id: string;
@@ -78,6 +111,11 @@ function App() {
   const [hasMore, setHasMore] = useState(true);
   const [isExactMatch, setIsExactMatch] = useState(false);
   const [totalResults, setTotalResults] = useState(0);
+  const [isTotalExact, setIsTotalExact] = useState(true);
+  const [isPartial, setIsPartial] = useState(false);
+  // 新しい検索ごとに増やす番号と、実行中の正確な件数の取得。古い検索の件数で表示を上書きしないために使う
+  const searchGenerationRef = useRef(0);
+  const countAbortRef = useRef<AbortController | null>(null);
   const [dateFrom, setDateFrom] = useState('');
   const [dateTo, setDateTo] = useState('');
   const [authorName, setAuthorName] = useState('');
@@ -134,10 +172,27 @@ function App() {
   }, [emojiMap]);
 
   // 動画一覧を取得
+  // 前回取得した一覧をlocalStorageに保持し、それより新しい動画のみを差分取得する
   useEffect(() => {
-    axios.get(`${API_BASE_URL}/videos`)
+    const cached = loadCachedVideos();
+    if (cached) {
+      setVideos(cached.videos);
+    }
+    const params = cached?.latest ? { since: cached.latest } : undefined;
+    axios.get(`${API_BASE_URL}/videos`, { params })
       .then(response => {
-        setVideos(response.data.videos);
+        const { videos: fetched, latest } = response.data;
+        let merged: Video[] = fetched;
+        if (cached) {
+          const fetchedIds = new Set(fetched.map((video: Video) => video.videoId));
+          merged = [...fetched, ...cached.videos.filter(video => !fetchedIds.has(video.videoId))];
+        }
+        setVideos(merged);
+        saveCachedVideos({
+          videos: merged,
+          latest: latest ?? null,
+          fetchedAt: cached ? cached.fetchedAt : Date.now(),
+        });
       })
       .catch(error => {
         console.error("Error fetching videos:", error);
@@ -146,11 +201,20 @@ function App() {
 
   // デバウンスされたAPIリクエスト
   const debouncedSearch = useCallback((query: string, reset: boolean = false) => {
+    if (reset) {
+      searchGenerationRef.current += 1;
+      countAbortRef.current?.abort();
+      countAbortRef.current = null;
+    }
+    const generation = searchGenerationRef.current;
+
     if (query.trim() === '' && authorName.trim() === '' && !selectedVideoId) {
       setSearchResults([]);
       setFrom(0);
       setHasMore(true);
       setTotalResults(0);
+      setIsTotalExact(true);
+      setIsPartial(false);
       return;
     }
 
@@ -175,15 +239,35 @@ function App() {
 
     axios.get(`${API_BASE_URL}/search?${params.toString()}`)
       .then(response => {
-        const { total, results } = response.data;
+        const { total, totalExact, partial, results } = response.data;
         if (results.length === 0) {
           setHasMore(false);
         } else {
           setSearchResults(prevResults => reset ? results : [...prevResults, ...results]);
           setFrom(prevFrom => prevFrom + results.length);
         }
-        if (reset) {
+        if (reset && generation === searchGenerationRef.current) {
           setTotalResults(total);
+          setIsTotalExact(totalExact !== false);
+          setIsPartial(partial === true);
+          if (totalExact === false) {
+            // 件数が下限値の場合は、1ページ目を表示した後で正確な件数を取得する
+            const countParams = new URLSearchParams(params);
+            countParams.delete('from_');
+            countParams.delete('sort_order');
+            const controller = new AbortController();
+            countAbortRef.current = controller;
+            axios.get(`${API_BASE_URL}/count?${countParams.toString()}`, { signal: controller.signal })
+              .then(countResponse => {
+                if (generation !== searchGenerationRef.current) return;
+                setTotalResults(countResponse.data.total);
+                setIsTotalExact(true);
+              })
+              .catch(error => {
+                if (axios.isCancel(error)) return;
+                console.error("Error fetching total count:", error);
+              });
+          }
         }
       })
       .catch(error => {
@@ -507,7 +591,10 @@ function App() {
           <section className="space-y-4">
             <div className="flex justify-between items-center">
               <h3 className="text-lg font-semibold text-slate-800">
-                検索結果 ({totalResults.toLocaleString()}件)
+                検索結果 ({totalResults.toLocaleString()}件{isTotalExact ? '' : '以上'})
+                {isPartial && (
+                  <span className="ml-2 text-xs font-normal text-slate-500">検索に時間がかかったため、一部の結果のみ表示しています</span>
+                )}
               </h3>
               <button
                 onClick={() => setSortOrder(prev => prev === 'desc' ? 'asc' : 'desc')}